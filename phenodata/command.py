@@ -3,16 +3,17 @@
 """
 phenodata is an acquisition and processing toolkit for open access phenology data.
 """
+import contextlib
+import math
+import os
 import sys
 import logging
 from docopt import docopt, DocoptExit
-from tabulate import tabulate
 from phenodata import __appname__, __version__
-from phenodata.dwd.export import export_database
-from phenodata.ftp import FTPSession
-from phenodata.dwd.cdc import DwdCdcClient
-from phenodata.dwd.pheno import DwdPhenoDataClient, DwdPhenoDataHumanizer
-from phenodata.util import boot_logging, normalize_options, options_convert_lists
+from phenodata.util import boot_logging, normalize_options, options_convert_lists, read_list
+
+# Modules using pandas, SQLAlchemy, and other heavy dependencies are imported
+# within the code paths using them, so short commands like "info" start quickly.
 
 logger = logging.getLogger(__name__)
 
@@ -21,18 +22,20 @@ def run():
     """
     Usage:
       phenodata info
-      phenodata list-species --source=dwd [--format=csv]
-      phenodata list-phases --source=dwd [--format=csv]
-      phenodata list-stations --source=dwd --dataset=immediate [--all] [--filter=berlin] [--sort=Stationsname] [--format=csv]
-      phenodata nearest-station --source=dwd --dataset=immediate --latitude=52.520007 --longitude=13.404954 [--format=csv]
-      phenodata nearest-stations --source=dwd --dataset=immediate --latitude=52.520007 --longitude=13.404954 [--all] [--limit=10] [--format=csv]
-      phenodata list-quality-levels --source=dwd [--format=csv]
-      phenodata list-quality-bytes --source=dwd [--format=csv]
+      phenodata list-species --source=dwd [--format=csv] [--output=results.csv]
+      phenodata list-phases --source=dwd [--format=csv] [--output=results.csv]
+      phenodata list-stations --source=dwd --dataset=immediate [--all] [--filter=berlin] [--match=prefix] [--sort=Stationsname] [--format=csv] [--output=results.csv]
+      phenodata nearest-station --source=dwd --dataset=immediate --latitude=52.520007 --longitude=13.404954 [--format=csv] [--output=results.csv]
+      phenodata nearest-stations --source=dwd --dataset=immediate --latitude=52.520007 --longitude=13.404954 [--all] [--limit=10] [--radius=25000] [--format=csv] [--output=results.csv]
+      phenodata nearest-stations --source=dwd --dataset=immediate --input=positions.csv [--all] [--limit=10] [--radius=25000] [--format=csv] [--output=results.csv]
+      phenodata list-quality-levels --source=dwd [--format=csv] [--output=results.csv]
+      phenodata list-quality-bytes --source=dwd [--format=csv] [--output=results.csv]
       phenodata list-filenames --source=dwd --dataset=immediate --partition=recent [--filename=Hasel,Schneegloeckchen] [--year=2017]
       phenodata list-urls --source=dwd --dataset=immediate --partition=recent [--filename=Hasel,Schneegloeckchen] [--year=2017]
-      phenodata (observations|forecast) --source=dwd --dataset=immediate --partition=recent [--filename=Hasel,Schneegloeckchen] [--station-id=164,717] [--species-id=113,127] [--phase-id=5] [--quality-level=10] [--quality-byte=1,2,3] [--station=berlin,brandenburg] [--species=hazel,snowdrop] [--species-preset=mellifera-de-primary] [--phase=flowering] [--quality=ROUTKLI] [--year=2017] [--forecast-year=2021] [--humanize] [--show-ids] [--language=german] [--long-station] [--sort=Datum] [--sql=sql] [--format=csv] [--verbose]
-      phenodata export-observations --source=dwd --dataset=immediate --partition=recent --target=sqlite:///phenodata-dwd-sample.sqlite [--filename=Hasel,Schneegloeckchen] [--station-id=164,717] [--species-id=113,127] [--phase-id=5] [--station=berlin,brandenburg] [--species=hazel,snowdrop] [--species-preset=mellifera-de-primary] [--year=2017] [--format=sqlite] [--verbose]
-      phenodata export-observations-all --source=dwd [--verbose]
+      phenodata (observations|forecast) --source=dwd --dataset=immediate --partition=recent [--filename=Hasel,Schneegloeckchen] [--station-id=164,717] [--species-id=113,127] [--phase-id=5] [--quality-level=10] [--quality-byte=1,2,3] [--station=berlin,brandenburg] [--species=hazel,snowdrop] [--species-preset=mellifera-de-primary] [--phase=flowering] [--quality=ROUTKLI] [--year=2017] [--forecast-year=2021] [--humanize] [--show-ids] [--language=german] [--long-station] [--sort=Datum] [--sql=sql] [--limit=100] [--offset=0] [--format=csv] [--output=results.csv] [--parse-workers=4] [--cache-results] [--store=phenodata-dwd] [--verbose]
+      phenodata export-observations --source=dwd --dataset=immediate --partition=recent --target=sqlite:///phenodata-dwd-sample.sqlite [--filename=Hasel,Schneegloeckchen] [--station-id=164,717] [--species-id=113,127] [--phase-id=5] [--station=berlin,brandenburg] [--species=hazel,snowdrop] [--species-preset=mellifera-de-primary] [--year=2017] [--format=sqlite] [--incremental] [--materialize] [--fulltext] [--parse-workers=4] [--verbose]
+      phenodata export-observations-all --source=dwd [--incremental] [--materialize] [--fulltext] [--export-workers=4] [--parse-workers=4] [--verbose]
+      phenodata sync --source=dwd --store=phenodata-dwd [--parse-workers=4] [--verbose]
       phenodata drop-cache --source=dwd
       phenodata --version
       phenodata (-h | --help)
@@ -42,6 +45,12 @@ def run():
       --dataset=<dataset>       Data set. Use "immediate" or "annual" for "--source=dwd".
       --partition=<dataset>     Partition. Use "recent" or "historical" for "--source=dwd".
       --filename=<file>         Filter by file names (comma-separated list)
+      --parse-workers=<count>   Parse CSV files using designated number of worker processes.
+      --cache-results           Cache results of "observations" and "forecast" until source files
+                                change. Needs the "pyarrow" package. Use "drop-cache" to clear.
+      --store=<path>            Path to local observation store. "sync" updates it with all changed
+                                files, "observations" and "forecast" read from it instead of FTP.
+                                Needs the "pyarrow" package.
 
     Direct filtering options:
       --year=<year>             Filter by year (comma-separated list)
@@ -49,6 +58,16 @@ def run():
       --species-id=<species-id> Filter by species identifiers (comma-separated list)
       --phase-id=<phase-id>     Filter by phase identifiers (comma-separated list)
 
+    Station options:
+      --latitude=<latitude>     Latitude of position. Use a comma-separated list for multiple positions.
+      --longitude=<longitude>   Longitude of position. Use a comma-separated list for multiple positions.
+      --input=<file>            Read positions from CSV file with "latitude" and "longitude" columns.
+                                Use "-" to read from stdin. Other columns are passed through.
+      --radius=<radius>         Only select stations within designated distance in meters.
+      --filter=<filter>         Filter "list-stations" by name or region.
+      --match=<match>           Match "--filter" as "substring", by word "prefix", or "fuzzy".
+                                [default: substring]
+
     Humanized filtering options:
       --station=<station>       Filter by strings from "stations" data (comma-separated list)
       --species=<species>       Filter by strings from "species" data (comma-separated list)
@@ -57,24 +76,45 @@ def run():
                                 The preset will get loaded from the "presets.json" file.
 
     Forecasting options:
-      --forecast-year=<year>    Use as designated forecast year.
+      --forecast-year=<year>    Use as designated forecast year (comma-separated list)
 
     Postprocess filtering options:
-      --sql=<sql>               Apply given SQL query before output.
+      --sql=<sql>               Apply given SQL query before output. With "--store", the query runs
+                                directly against the store, and can also use the views "observation",
+                                "station", "species", "phase", "quality_level", and "quality_byte".
+
+    Export options:
+      --target=<target>         Export to database at SQLAlchemy URL, like "sqlite:///phenodata.sqlite",
+                                to a DuckDB database, using "duckdb:///phenodata.duckdb", or to a
+                                directory of Parquet or Arrow IPC (Feather) files, using
+                                "parquet:///path/to/directory" or "feather:///path/to/directory".
+      --incremental             Only replace observations of source files which changed since the
+                                last incremental export, recorded in the "dwd_export_file" table.
+      --materialize             Create "dwd_phenology" and "dwd_phenology_group" as indexed tables
+                                instead of views, for faster queries.
+      --fulltext                Index names of stations, species, and phases for full text search,
+                                queried through "dwd_station_search" and similar views. Needs
+                                SQLite or PostgreSQL.
+      --export-workers=<count>  Number of databases "export-observations-all" exports concurrently.
+                                Defaults to all four combinations of dataset and partition.
 
     Data output options:
       --format=<format>         Output data in designated format. Choose one of "tabular", "json",
-                                "csv", or "string". With "tabular", it is also possible to specify
-                                the table format. Use "tabular:pipe" for Markdown output, or
-                                "tabular:rst" for reStructuredText. [default: tabular:psql]
+                                "ndjson", "csv", "string", or the binary formats "parquet" and
+                                "arrow" (IPC stream), which need the "pyarrow" package. With
+                                "tabular", it is also possible to specify the table format. Use
+                                "tabular:pipe" for Markdown output, or "tabular:rst" for
+                                reStructuredText. [default: tabular:psql]
+      --output=<file>           Write output to designated file instead of stdout.
       --sort=<sort>             Sort by given field names. (comma-separated list)
       --humanize                Resolve identifier-based fields to human-readable labels.
       --show-ids                Show identifiers alongside resolved labels, when using "--humanize".
       --language=<language>     Use labels in designated language, when using "--humanize"
                                 [default: english].
       --long-station            Use long station name including "Naturraumgruppe" and "Naturraum".
-      --limit=<limit>           Limit output of "nearest-stations" to designated number of entries.
-                                [default: 10]
+      --limit=<limit>           Limit output to designated number of entries. For "nearest-stations",
+                                this is the number of stations per position, defaulting to 10.
+      --offset=<offset>         Skip designated number of entries, when using "--limit".
       --verbose                 Turn on verbose output.
     """
 
@@ -93,6 +133,7 @@ def run():
     # Expand options
     preset_name = options['species-preset']
     if preset_name:
+        from phenodata.dwd.pheno import DwdPhenoDataClient
         options['species'] = DwdPhenoDataClient.load_preset('options', 'species', preset_name)
 
     # Coerce comma-separated list fields
@@ -104,6 +145,9 @@ def run():
         # Filter parameters
         'year',
 
+        # Forecasting parameters
+        'forecast-year',
+
         # ID parameters
         'quality-level',
         'quality-byte',
@@ -133,9 +177,19 @@ def run():
 
     # Create data source adapter
     if options['source'] == 'dwd':
-        cdc_client = DwdCdcClient(ftp=FTPSession())
+        from phenodata.ftp import FTPSession
+        from phenodata.dwd.cdc import DwdCdcClient
+        from phenodata.dwd.pheno import DwdPhenoDataClient, DwdPhenoDataHumanizer, ResultCache
+        parse_workers = options['parse-workers'] and int(options['parse-workers'])
+        cdc_client = DwdCdcClient(ftp=FTPSession(), parse_workers=parse_workers)
         humanizer = DwdPhenoDataHumanizer(language=options['language'], long_station=options['long-station'], show_ids=options['show-ids'])
         client = DwdPhenoDataClient(cdc=cdc_client, humanizer=humanizer, dataset=options.get('dataset'))
+        if options['cache-results']:
+            cdc_client.ftp.ensure_cache_manager()
+            client.results = ResultCache(path=os.path.join(cdc_client.ftp.cache.cache_path, 'results'))
+        if options['store']:
+            from phenodata.dwd.warehouse import DwdPhenoWarehouse
+            client.store = DwdPhenoWarehouse(path=options['store'])
     else:
         message = 'Data source "{}" not implemented'.format(options['source'])
         logger.error(message)
@@ -143,12 +197,13 @@ def run():
 
     # Dispatch command
     data = None
+    sql = options['sql']
     if options['list-species']:
         data = client.get_species()
     elif options['list-phases']:
         data = client.get_phases()
     elif options['list-stations']:
-        data = client.get_stations(filter=options['filter'], all=options['all'])
+        data = client.get_stations(filter=options['filter'], all=options['all'], match=options['match'])
     elif options['list-quality-levels']:
         data = client.get_quality_levels()
     elif options['list-quality-bytes']:
@@ -163,17 +218,66 @@ def run():
         print('\n'.join(files))
         return
 
+    elif options['observations'] and sql and client.store is not None and not options['humanize']:
+        # Run SQL query directly against the store, instead of materializing all observations first
+        data = client.store.query(client, sql, partition=options['partition'], criteria=options)
+        sql = None
+
     elif options['observations']:
         data = client.get_observations(options, humanize=options['humanize'])
 
     elif options['forecast']:
         data = client.get_forecast(options, forecast_year=options['forecast-year'], humanize=options['humanize'])
 
-    elif options['nearest-station']:
-        data = client.nearest_station(float(options['latitude']), float(options['longitude']), all=options['all'])
+    elif options['nearest-stations'] and options['input']:
+        import pandas as pd
+        from phenodata.writer import DataFrameStreamWriter
+        limit = int(options['limit'] or 10)
+        if limit < 1:
+            message = 'Number of nearest stations "--limit" must be at least 1'
+            logger.error(message)
+            raise DocoptExit(message)
+        radius = options['radius'] and float(options['radius'])
+        positions = pd.read_csv(sys.stdin if options['input'] == '-' else options['input'], chunksize=10_000)
+        results = client.nearest_stations_stream(positions, all=options['all'], limit=limit, radius=radius)
+        output_format = options['format'].lower()
+        try:
+            if output_format in DataFrameStreamWriter.formats and not sql and not options['sort']:
+                with open_output(options) as stream, \
+                        DataFrameStreamWriter(stream, format=output_format, index=True) as writer:
+                    for result in results:
+                        writer.write(result)
+                return
+            data = pd.concat(results)
+        except ValueError as ex:
+            logger.error(ex)
+            sys.exit(1)
 
-    elif options['nearest-stations']:
-        data = client.nearest_stations(float(options['latitude']), float(options['longitude']), all=options['all'], limit=int(options['limit']))
+    elif options['nearest-station'] or options['nearest-stations']:
+        limit = 1 if options['nearest-station'] else int(options['limit'] or 10)
+        if limit < 1:
+            message = 'Number of nearest stations "--limit" must be at least 1'
+            logger.error(message)
+            raise DocoptExit(message)
+        radius = options['radius'] and float(options['radius'])
+        latitudes = list(map(float, read_list(options['latitude'])))
+        longitudes = list(map(float, read_list(options['longitude'])))
+        if not all(map(math.isfinite, latitudes + longitudes)):
+            message = 'Latitude and longitude values must be finite numbers'
+            logger.error(message)
+            raise DocoptExit(message)
+        if len(latitudes) != len(longitudes):
+            message = 'Number of latitude and longitude values must match'
+            logger.error(message)
+            raise DocoptExit(message)
+        if len(latitudes) == 1:
+            data = client.nearest_stations(latitudes[0], longitudes[0], all=options['all'], limit=limit, radius=radius)
+        else:
+            data = client.nearest_stations_batch(list(zip(latitudes, longitudes)), all=options['all'], limit=limit, radius=radius)
+
+    elif options['sync']:
+        client.store.sync(cdc_client)
+        return
 
     elif options['drop-cache']:
         client.cdc.ftp.ensure_cache_manager()
@@ -184,28 +288,23 @@ def run():
         return
 
     elif options['export-observations']:
+        from phenodata.dwd.export import export_database
         target = options['target']
         export_database(client, target, options)
 
     elif options['export-observations-all']:
-        source = options["source"]
-        for partition in ["recent", "historical"]:
-            for dataset in ["immediate", "annual"]:
-                dbname = f"phenodata-{source}-{dataset}-{partition}.sqlite"
-                target = f"sqlite:///{dbname}"
-                options["dataset"] = dataset
-                options["partition"] = partition
-                logger.debug(f"Running database export with options: {options}")
-                client = DwdPhenoDataClient(cdc=cdc_client, humanizer=humanizer, dataset=options.get('dataset'))
-                export_database(client, target, options)
+        from phenodata.dwd.export import export_database_all
+        export_workers = options['export-workers'] and int(options['export-workers'])
+        export_database_all(cdc_client, humanizer, options, workers=export_workers)
 
     # Query results
-    if data is not None and options["sql"]:
+    if data is not None and sql:
         import duckdb
-        data = duckdb.query(query=options["sql"], alias="data").df()
+        data = duckdb.query(query=sql, alias="data").df()
 
     # Format and output results
     if data is not None:
+        from phenodata.writer import DataFrameStreamWriter, TableRenderer, columnar_formats, write_columnar
 
         output_format = options['format'].lower()
 
@@ -216,22 +315,42 @@ def run():
             # Don't display index column.
             showindex = False
 
-            # Apply minor cosmetic amendments.
-            date_field_candidates = ['Eintrittsdatum', 'Datum']
-            for date_field in date_field_candidates:
-                if date_field in data:
-                    data[date_field] = data[date_field].astype(str)
+            # Apply minor cosmetic amendments, unless the output format preserves dtypes.
+            if output_format not in columnar_formats:
+                date_field_candidates = ['Eintrittsdatum', 'Datum']
+                for date_field in date_field_candidates:
+                    if date_field in data:
+                        data[date_field] = data[date_field].astype(str)
 
         # Sort columns
         if options['sort']:
             data.sort_values(options['sort'], inplace=True)
 
+        # Select page of results
+        if (options['observations'] or options['forecast']) and (options['limit'] or options['offset']):
+            offset = int(options['offset'] or 0)
+            limit = options['limit'] and int(options['limit'])
+            data = data.iloc[offset:offset + limit if limit else None]
+
         # Handle aliases for reStructuredText and Markdown
         if output_format in ["restructuredtext", "rst"]:
             output_format = "tabular:rst"
         elif output_format in ["markdown", "md"]:
             output_format = "tabular:pipe"
 
+        # Write binary columnar output
+        if output_format in columnar_formats:
+            with open_output(options, binary=True) as stream:
+                write_columnar(data, stream, format=output_format, index=showindex)
+            return
+
+        # Stream CSV and JSON output batch by batch
+        if output_format in DataFrameStreamWriter.formats:
+            with open_output(options) as stream, \
+                    DataFrameStreamWriter(stream, format=output_format, index=showindex) as writer:
+                writer.write(data)
+            return
+
         output = None
         if output_format.startswith('tabular'):
 
@@ -240,17 +359,16 @@ def run():
             except:
                 tablefmt = 'psql'
 
+            # Render large tables quickly, page by page
+            if tablefmt in TableRenderer.formats and len(data) and len(data.columns):
+                with open_output(options) as stream:
+                    TableRenderer(stream, format=tablefmt, index=showindex).render(data)
+                return
+
             # TODO: How to make "tabulate" print index column name?
+            from tabulate import tabulate
             output = tabulate(data, headers=data.columns, showindex=showindex, tablefmt=tablefmt)
 
-        elif output_format == 'csv':
-            output = data.to_csv(encoding='utf-8', index=showindex)
-
-        elif output_format == 'json':
-            if showindex:
-                data = data.reset_index()
-            output = data.to_json(orient='records', date_format='iso')
-
         elif output_format == 'string':
             output = data.to_string()
 
@@ -260,9 +378,20 @@ def run():
             sys.exit(1)
 
         if output is not None:
-            if sys.version_info.major == 2:
-                print(output.encode('utf-8'))
-            else:
-                print(output)
+            with open_output(options) as stream:
+                print(output, file=stream)
         else:
             logger.warning('Empty output')
+
+
+def open_output(options, binary=False):
+    """
+    Open file designated by ``--output`` option for writing, or use stdout.
+    """
+    if binary:
+        if options['output']:
+            return open(options['output'], 'wb')
+        return contextlib.nullcontext(sys.stdout.buffer)
+    if options['output']:
+        return open(options['output'], 'w', encoding='utf-8', newline='')
+    return contextlib.nullcontext(sys.stdout)
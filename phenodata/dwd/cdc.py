@@ -2,6 +2,9 @@
 # (c) 2018-2023, The Earth Observations Developers
 import logging
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import attr
 import pandas as pd
 from six import StringIO
@@ -23,6 +26,9 @@ class DwdCdcClient:
     # Instance of ``phenodata.ftp.FTPSession`` object for lowlevel access to CDC FTP
     ftp = attr.ib()
 
+    # Number of worker processes for parsing CSV files, see ``get_dataframes``
+    parse_workers = attr.ib(default=None)
+
     def get_dataframe(self, url=None, path=None, index_column=None, coerce_int=False) -> pd.DataFrame:
         """
         Read single CSV file from FTP url and convert to pandas DataFrame object.
@@ -36,11 +42,59 @@ class DwdCdcClient:
 
         Optionally obtains ``coerce_int`` parameter.
         Use this to convert all values to integer format.
+
+        Returns ``None`` when the resource is empty.
         """
         if path:
             url = self.baseurl + path
         logger.info("Retrieving resource {}".format(url))
-        return self.csv_to_dataframe(self.read_csv(url), index_column=index_column, coerce_int=coerce_int)
+        stream = self.read_csv(url)
+        if stream is None:
+            return None
+        return self.csv_to_dataframe(stream, index_column=index_column, coerce_int=coerce_int)
+
+    def get_dataframes(self, urls, index_column=None, coerce_int=False):
+        """
+        Read multiple CSV files from FTP urls and convert them to pandas DataFrame objects.
+
+        Yields tuples of ``(url, DataFrame)``, in the same order as the ``urls`` parameter.
+        The DataFrame will be ``None`` when the resource is empty.
+
+        When ``self.parse_workers`` is set, the CPU-bound work of parsing the CSV payloads
+        will be distributed to a pool of worker processes, while retrieving resources
+        will be done by the parent process. Parsed DataFrames are returned to the parent
+        process as Arrow IPC buffers, so this needs the ``pyarrow`` package.
+        """
+
+        if not self.parse_workers or self.parse_workers <= 1:
+            for url in urls:
+                yield url, self.get_dataframe(url, index_column=index_column, coerce_int=coerce_int)
+            return
+
+        # Keep a bounded number of payloads in flight, so memory usage stays under control
+        window = self.parse_workers * 2
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            for url in urls:
+                logger.info("Retrieving resource {}".format(url))
+                content = self.ftp.retr_cached(url, strip_base=self.baseurl)
+                future = None
+                if content:
+                    future = pool.submit(parse_csv_to_arrow, url, content, index_column=index_column, coerce_int=coerce_int)
+                pending.append((url, future))
+                if len(pending) >= window:
+                    yield self._wait_dataframe(*pending.popleft())
+            while pending:
+                yield self._wait_dataframe(*pending.popleft())
+
+    @staticmethod
+    def _wait_dataframe(url, future):
+        """
+        Wait for worker process to parse CSV content, and decode its result.
+        """
+        if future is None:
+            return url, None
+        return url, arrow_to_dataframe(future.result())
 
     def read_csv(self, url):
         """
@@ -55,6 +109,13 @@ class DwdCdcClient:
         if not content:
             return
 
+        return self.fixup_csv(url, content)
+
+    def fixup_csv(self, url, content):
+        """
+        Fixup different anomalies of CSV content to make it compatible with ``pandas.read_csv``.
+        """
+
         # Fix CSV formatting
         content = content.strip()
         content = content.replace('\r\n', '')
@@ -164,3 +225,27 @@ class DwdCdcClient:
             df.set_index(index_column_name, inplace=True)
 
         return df
+
+
+def parse_csv_to_arrow(url, content, index_column=None, coerce_int=False) -> bytes:
+    """
+    Parse CSV content into pandas DataFrame, and serialize it into an Arrow IPC stream.
+
+    This is the unit of work for worker processes, see ``DwdCdcClient.get_dataframes``.
+    """
+    import pyarrow as pa
+    client = DwdCdcClient(ftp=None)
+    df = client.csv_to_dataframe(client.fixup_csv(url, content), index_column=index_column, coerce_int=coerce_int)
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_to_dataframe(buffer: bytes) -> pd.DataFrame:
+    """
+    Decode Arrow IPC stream into pandas DataFrame, see ``parse_csv_to_arrow``.
+    """
+    import pyarrow as pa
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
@@ -1,28 +1,38 @@
 # -*- coding: utf-8 -*-
 # (c) 2023, The Earth Observations Developers
 import datetime
+import json
 import logging
 import sys
+import time
 import typing as t
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+import attr
 import pandas as pd
 
 from phenodata import __appname__, __version__
-from phenodata.dwd.model import DwdPhenoDataset, DwdPhenoDatabase, DwdPhenoPartition
-from phenodata.dwd.pheno import DwdPhenoDataClient
+from phenodata.dwd.model import CanonicalColumnMap, DwdPhenoDataset, DwdPhenoDatabase, DwdPhenoPartition
+from phenodata.dwd.cdc import DwdCdcClient
+from phenodata.dwd.pheno import DimensionTableRegistry, DwdPhenoDataClient, DwdPhenoDataHumanizer
+from phenodata.ftp import FTPSession
+from phenodata.util import iterate_with_progressbar
 
 
 logger = logging.getLogger(__name__)
 
 
-def acquire_database(client: DwdPhenoDataClient, options: t.Optional[t.Dict[str, str]] = None) -> DwdPhenoDatabase:
+def acquire_database(client: DwdPhenoDataClient, options: t.Optional[t.Dict[str, str]] = None, observation: t.Optional[pd.DataFrame] = None) -> DwdPhenoDatabase:
     options = options or {}
+    if observation is None:
+        observation = client.get_observations(options=options)
     dataset = options.get("dataset", "unknown")
     partition = options.get("partition", "unknown")
 
     species = client.get_species()
-    species_group = get_species_groups(species)
+    species_group = DimensionTableRegistry.view(client.dimensions.derive(
+        client.cdc, '/help/PH_Beschreibung_Pflanze.txt', 'species_group', lambda: get_species_groups(species), index_column=0))
 
     db = DwdPhenoDatabase(
         dataset=DwdPhenoDataset(dataset),
@@ -34,7 +44,7 @@ def acquire_database(client: DwdPhenoDataClient, options: t.Optional[t.Dict[str,
         quality_level=client.get_quality_levels(),
         quality_byte=client.get_quality_bytes(),
         station=client.get_stations(filter=options['filter'], all=options['all']),
-        observation=client.get_observations(options=options),
+        observation=observation,
     )
     db.observation["source"] = "dwd"
     db.observation["dataset"] = db.dataset.name.lower()
@@ -42,17 +52,174 @@ def acquire_database(client: DwdPhenoDataClient, options: t.Optional[t.Dict[str,
     return db
 
 
-def export_database(client, target, options):
+def export_database(client, target, options, info=True, position=None) -> int:
+    """
+    Export observations and dimension tables to database at ``target``, and return the number of exported observations.
+
+    Observations are streamed into the database file by file, see ``iterate_observations``,
+    so memory usage does not scale with the size of the export.
+
+    ``target`` is an SQLAlchemy database URL, or ``parquet:///<path>`` or ``feather:///<path>``
+    to write a directory of Parquet or Arrow IPC files, see ``DwdPhenoDatabase.to_dataset``,
+    or ``duckdb:///<path>`` to write a DuckDB database, see ``DwdPhenoDatabase.to_duckdb``.
+
+    ``position`` is the line of the progress bar, when running multiple exports concurrently.
+    """
     if sys.version_info <= (3, 7):
         raise DeprecationWarning("The SQLite export feature does not work on Python 3.7")
     logger.info(f"Exporting data to {target}")
     # TODO: Warn that specific options will not be honored.
-    db = acquire_database(client=client, options=options).with_canonical_column_names()
-    db.info()
-    db.to_sql(target)
-    # Optionally print samples.
-    # print(db.observations)
-    logger.info(f"Exported data to {target}")
+    materialize = bool(options.get("materialize"))
+    fulltext = bool(options.get("fulltext"))
+    scheme, path = split_target(target)
+    if (scheme in DwdPhenoDatabase.dataset_formats or scheme == "duckdb") and options.get("incremental"):
+        raise ValueError("Incremental exports are only supported for SQL databases using SQLAlchemy")
+    if (scheme in DwdPhenoDatabase.dataset_formats or scheme == "duckdb") and fulltext:
+        raise ValueError("Full text search is only supported for SQL databases using SQLAlchemy")
+    db = acquire_database(client=client, options=options, observation=empty_observation()).with_canonical_column_names()
+    if info:
+        db.info()
+    if scheme in DwdPhenoDatabase.dataset_formats:
+        entries = client.scan_files(options["partition"], include=options.get("filename"))
+        count = db.to_dataset(path, format=scheme, observations=iterate_observations(client, entries, options, position=position))
+    elif scheme == "duckdb":
+        entries = client.scan_files(options["partition"], include=options.get("filename"))
+        count = db.to_duckdb(path, materialize=materialize, observations=iterate_observations(client, entries, options, position=position))
+    elif options.get("incremental"):
+        observations, files, changed = acquire_changed_observations(client, target, options, position=position)
+        count = db.to_sql_incremental(target, observations=observations, files=files, changed=changed, materialize=materialize, fulltext=fulltext)
+    else:
+        entries = client.scan_files(options["partition"], include=options.get("filename"))
+        count = db.to_sql(target, materialize=materialize, fulltext=fulltext, observations=iterate_observations(client, entries, options, position=position))
+    logger.info(f"Exported {count} observations to {target}")
+    return count
+
+
+def split_target(target: str) -> t.Tuple[str, str]:
+    """
+    Split export target into scheme and path. Like with SQLAlchemy URLs, use three
+    slashes for relative paths, like ``duckdb:///phenodata.duckdb``, and four
+    slashes for absolute paths.
+    """
+    scheme, _, path = target.partition("://")
+    if path.startswith("/"):
+        path = path[1:]
+    return scheme, path
+
+
+def iterate_observations(client: DwdPhenoDataClient, entries: t.List[t.Dict], options: t.Dict[str, str], position: t.Optional[int] = None) -> t.Generator[pd.DataFrame, None, None]:
+    """
+    Acquire observations of the source files listed in ``entries``, as returned by
+    ``DwdPhenoDataClient.scan_files``, and yield a DataFrame for each.
+
+    Each DataFrame is filtered like the result of ``DwdPhenoDataClient.get_observations``,
+    and records the name of its source file within the ``file`` column. Text-based
+    criteria are resolved to identifiers only once, see ``DwdPhenoDataClient.resolve_patterns``.
+    """
+    names = {entry["url"]: entry["name"] for entry in entries}
+    desc = f"{client.dataset}/{options['partition']}"
+    resolved = client.resolve_patterns(options)
+    for url, data in iterate_with_progressbar(client.cdc.get_dataframes(list(names), coerce_int=True), total=len(names), desc=desc, position=position):
+        if data is None or data.empty:
+            logger.warning(f'File "{url}" is empty')
+            continue
+        data = client.filter_by_references(client.filter_by_ids(data, options), resolved)
+        data = client.convert_dates(data)
+        data["file"] = names[url]
+        yield data
+
+
+def empty_observation() -> pd.DataFrame:
+    """
+    Placeholder for observations which will be streamed, see ``iterate_observations``.
+    """
+    observation = pd.DataFrame(columns=list(CanonicalColumnMap.observation.column_map) + ["file"])
+    observation.attrs["name"] = "observation"
+    return observation
+
+
+def export_database_all(cdc: DwdCdcClient, humanizer: DwdPhenoDataHumanizer, options: t.Dict[str, str], workers: t.Optional[int] = None) -> pd.DataFrame:
+    """
+    Export all combinations of dataset and partition into separate SQLite databases, concurrently.
+
+    Each export runs in its own thread, using its own FTP session, and its own line
+    of the progress bar display. Dimension tables, and species groups derived from
+    them, are loaded once and shared between all of them. CSV files can additionally
+    be parsed by worker processes, see ``DwdCdcClient.parse_workers``.
+
+    Returns a DataFrame summarizing the number of observations and the throughput per target.
+    """
+    from tqdm.contrib.logging import logging_redirect_tqdm
+
+    source = options["source"]
+    dimensions = DimensionTableRegistry()
+
+    jobs = []
+    for partition in ["recent", "historical"]:
+        for dataset in ["immediate", "annual"]:
+            target = f"sqlite:///phenodata-{source}-{dataset}-{partition}.sqlite"
+            jobs.append((target, {**options, "dataset": dataset, "partition": partition}))
+
+    def run(position, target, job_options):
+        logger.debug(f"Running database export with options: {job_options}")
+        ftp = FTPSession()
+        try:
+            client = DwdPhenoDataClient(cdc=attr.evolve(cdc, ftp=ftp), humanizer=humanizer,
+                                        dataset=job_options["dataset"], dimensions=dimensions)
+            start = time.perf_counter()
+            rows = export_database(client, target, job_options, info=False, position=position)
+            duration = time.perf_counter() - start
+        finally:
+            ftp.close()
+        logger.info(f"Exported {rows} observations to {target} in {duration:.1f} seconds")
+        return {"target": target, "observations": rows, "seconds": duration}
+
+    # Redirect log messages once for all progress bars, see ``iterate_with_progressbar``
+    start = time.perf_counter()
+    with logging_redirect_tqdm(), ThreadPoolExecutor(max_workers=workers or len(jobs)) as pool:
+        futures = [pool.submit(run, position, target, job_options) for position, (target, job_options) in enumerate(jobs)]
+        summary = pd.DataFrame([future.result() for future in futures])
+    duration = time.perf_counter() - start
+
+    # Very short exports may take no measurable time
+    summary["rate"] = summary["observations"] / summary["seconds"].where(summary["seconds"] > 0)
+    for item in summary.itertuples():
+        logger.info(f"{item.target}: {item.observations} observations, {item.seconds:.1f} seconds, {item.rate:.0f} observations/s")
+    total = summary["observations"].sum()
+    rate = total / duration if duration > 0 else float("nan")
+    logger.info(f"Exported {total} observations to {len(jobs)} databases in {duration:.1f} seconds, {rate:.0f} observations/s")
+
+    return summary
+
+
+def acquire_changed_observations(client: DwdPhenoDataClient, target: str, options: t.Dict[str, str], position: t.Optional[int] = None) -> t.Tuple[t.Iterator[pd.DataFrame], pd.DataFrame, t.List[str]]:
+    """
+    Acquire observations of source files which changed since the last incremental export to ``target``.
+
+    A source file is considered changed when its modification time, or the export
+    criteria, differ from the ones recorded in the database. Returns the observations
+    of the changed files, see ``iterate_observations``, the list of all current
+    source files, and the names of all changed or vanished source files.
+    """
+    dataset = options["dataset"]
+    partition = options["partition"]
+    criteria = json.dumps(client.get_observations_criteria(options), sort_keys=True)
+
+    entries = client.scan_files(partition, include=options.get("filename"))
+    files = pd.DataFrame([
+        {"source": "dwd", "dataset": dataset, "partition": partition, "file": entry["name"], "mtime": str(entry["mtime"]), "criteria": criteria}
+        for entry in entries
+    ], columns=DwdPhenoDatabase.files_columns)
+
+    recorded = DwdPhenoDatabase.read_sql_files(target)
+    recorded = recorded[(recorded["source"] == "dwd") & (recorded["dataset"] == dataset) & (recorded["partition"] == partition)]
+    known = {item.file: (item.mtime, item.criteria) for item in recorded.itertuples()}
+
+    changed = [entry for entry in entries if known.get(entry["name"]) != (str(entry["mtime"]), criteria)]
+    vanished = sorted(set(known) - {entry["name"] for entry in entries})
+    logger.info(f"Exporting {len(changed)} of {len(entries)} files, removing {len(vanished)} vanished files")
+
+    return iterate_observations(client, changed, options, position=position), files, [entry["name"] for entry in changed] + vanished
 
 
 def get_species_groups(species: pd.DataFrame):
@@ -3,6 +3,8 @@
 import dataclasses
 import io
 import logging
+import os
+import shutil
 from contextlib import redirect_stdout
 from enum import Enum
 import typing as t
@@ -126,43 +128,572 @@ class DwdPhenoDatabase:
         Translate DWD column names to canonical english column names.
         """
         for slot in self.slots:
-            thing = slot
-            name = thing.attrs["name"]
-            transformer = getattr(CanonicalColumnMap, name, None)
-            if transformer:
-                thing = thing.rename(columns=transformer.column_map)
-                thing.index.names = transformer.index_names
-                setattr(self, name, thing)
+            name = slot.attrs["name"]
+            if hasattr(CanonicalColumnMap, name):
+                setattr(self, name, self.to_canonical(name, slot))
         return self
 
-    def to_sql(self, dsn: str):
+    @staticmethod
+    def to_canonical(name: str, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Translate DWD column names of designated table to canonical english column names.
         """
-        Export data to RDBMS/SQL database.
+        transformer = getattr(CanonicalColumnMap, name)
+        frame = frame.rename(columns=transformer.column_map)
+        frame.index.names = transformer.index_names
+        return frame
+
+    # Number of rows per batch when loading data into the database
+    chunksize = 10_000
+
+    # Minimum number of observations accumulated before writing them, when streaming, see ``to_sql_observations``
+    batch_size = 100_000
+
+    # Secondary indexes, by table name
+    indexes = {
+        "dwd_observation": ["station_id", "species_id", "phase_id", "reference_year", "date", "file"],
+        "dwd_species_group": ["group_name"],
+        "dwd_phenology": ["station_id", "species_id", "phase_id", "reference_year", "date"],
+        "dwd_phenology_group": ["group_name", "station_id", "species_id", "phase_id", "reference_year", "date"],
+    }
+
+    def to_sql(self, dsn: str, bulk: bool = True, materialize: bool = False,
+               observations: t.Optional[t.Iterable[pd.DataFrame]] = None, fulltext: bool = False) -> int:
+        """
+        Export data to RDBMS/SQL database, and return the number of exported observations.
+
+        On SQLite and PostgreSQL, tables are loaded using a bulk loader, see
+        ``to_sql_bulk``. Otherwise, or when ``bulk`` is false, use ``DataFrame.to_sql``.
+
+        When ``observations`` is given, observations are streamed from there instead of
+        ``self.observation``, see ``to_sql_observations``.
+
+        After loading, secondary indexes are created, see ``indexes``. When ``materialize``
+        is true, ``dwd_phenology`` and ``dwd_phenology_group`` will be created as
+        denormalized tables instead of views. When ``fulltext`` is true, names of
+        stations, species, and phases will be indexed, see ``to_sql_create_fulltext``.
         """
         engine = create_engine(dsn)
         with engine.connect() as connection:
-            connection.execute(sa.text("DROP VIEW IF EXISTS dwd_phenology;"))
-            connection.execute(sa.text("DROP VIEW IF EXISTS dwd_phenology_group;"))
+            self.to_sql_drop_views(connection)
+            connection.execute(sa.text(f"DROP TABLE IF EXISTS {self.files_table}"))
             connection.commit()
 
         for slot in self.slots:
-            name = slot.attrs["name"]
-            table_name = f"dwd_{name}"
-            slot.to_sql(name=table_name, con=engine, if_exists="replace", chunksize=10_000)
+            if observations is None or slot is not self.observation:
+                self.to_sql_table(engine, slot, f"dwd_{slot.attrs['name']}", bulk=bulk)
+
+        if observations is None:
+            count = len(self.observation)
+        else:
+            count = self.to_sql_observations(engine, observations, bulk=bulk)
 
-        self.to_sql_create_views(engine)
+        self.to_sql_create_views(engine, materialize=materialize)
+        if fulltext:
+            self.to_sql_create_fulltext(engine)
+        self.to_sql_analyze(engine)
+        return count
 
-    def to_sql_create_views(self, engine: Engine):
+    def to_sql_incremental(self, dsn: str, observations: t.Iterable[pd.DataFrame], files: pd.DataFrame,
+                           changed: t.List[str], bulk: bool = True, materialize: bool = False, fulltext: bool = False) -> int:
         """
-        Define views on top of physical tables.
+        Export data to RDBMS/SQL database, only replacing observations of changed source files.
+
+        - ``observations`` yields the observations of the changed source files, see
+          ``to_sql_observations``.
+        - ``files`` lists all current source files of the dataset and partition, see
+          ``files_columns``. It will be recorded within the ``dwd_export_file`` table.
+        - ``changed`` lists the names of the source files whose observations will be
+          deleted, including files which vanished.
+
+        Dimension tables are small, so they are replaced completely. When the database
+        has not been exported incrementally before, all tables are replaced.
+
+        The ``dwd_export_file`` table is updated last, so an interrupted run will
+        process the same files again. Returns the number of exported observations.
         """
+        engine = create_engine(dsn)
+        with engine.connect() as connection:
+            self.to_sql_drop_views(connection)
+            connection.commit()
+            inspector = sa.inspect(connection)
+            initial = not (inspector.has_table(self.files_table) and inspector.has_table("dwd_observation"))
+
+        for slot in self.slots:
+            if slot is not self.observation:
+                self.to_sql_table(engine, slot, f"dwd_{slot.attrs['name']}", bulk=bulk)
+
+        selector = "source = :source AND dataset = :dataset AND partition = :partition"
+        parameters = {"source": "dwd", "dataset": self.dataset.value, "partition": self.partition.value}
+
+        if initial:
+            logger.info("Database has not been exported incrementally before, replacing all observations")
+            count = self.to_sql_observations(engine, observations, bulk=bulk)
+            with engine.connect() as connection:
+                connection.execute(sa.text(f"DROP TABLE IF EXISTS {self.files_table}"))
+                connection.commit()
 
+        else:
+            logger.info(f"Replacing observations of {len(changed)} changed source files")
+            with engine.connect() as connection:
+                statement = sa.text(f"DELETE FROM dwd_observation WHERE {selector} AND file IN :files")
+                statement = statement.bindparams(sa.bindparam("files", expanding=True))
+                for start in range(0, len(changed), 500):
+                    connection.execute(statement, {**parameters, "files": changed[start:start + 500]})
+                start = connection.execute(sa.text("SELECT MAX(id) FROM dwd_observation")).scalar()
+                connection.commit()
+            start = 0 if start is None else start + 1
+            count = self.to_sql_observations(engine, observations, bulk=bulk, start=start, replace=False)
+
+        # Record source files
         with engine.connect() as connection:
-            connection.execute(sa.text("DROP VIEW IF EXISTS dwd_phenology;"))
-            connection.execute(sa.text("DROP VIEW IF EXISTS dwd_phenology_group;"))
+            if not initial:
+                connection.execute(sa.text(f"DELETE FROM {self.files_table} WHERE {selector}"), parameters)
+            files.to_sql(name=self.files_table, con=connection, if_exists="append", index=False)
             connection.commit()
-            connection.execute(sa.text("""
-CREATE VIEW dwd_phenology AS
+
+        self.to_sql_create_views(engine, materialize=materialize)
+        if fulltext:
+            self.to_sql_create_fulltext(engine)
+        self.to_sql_analyze(engine)
+        return count
+
+    def to_sql_observations(self, engine: Engine, observations: t.Iterable[pd.DataFrame], bulk: bool = True,
+                            start: int = 0, replace: bool = True) -> int:
+        """
+        Stream observations into the ``dwd_observation`` table, and return their number.
+
+        ``observations`` yields DataFrames using the original DWD column names, typically
+        one per source file. They are accumulated into batches of ``batch_size`` rows,
+        which are canonicalized, numbered consecutively from ``start``, and appended to
+        the table right away, so only one batch is kept in memory at a time.
+
+        With ``replace``, the table is replaced by the first batch, and secondary
+        indexes are created after loading all batches.
+        """
+        count = 0
+        for batch in self.iterate_observation_batches(observations, start=start):
+            fresh = replace and count == 0
+            self.to_sql_table(engine, batch, "dwd_observation", bulk=bulk,
+                              if_exists="replace" if fresh else "append", fresh=replace, create_indexes=False)
+            count += len(batch)
+
+        if replace:
+            if not count:
+                logger.warning("No observations found")
+                self.to_sql_table(engine, self.observation, "dwd_observation", bulk=bulk, create_indexes=False)
+            self.to_sql_create_indexes(engine, "dwd_observation")
+
+        return count
+
+    def iterate_observation_batches(self, observations: t.Iterable[pd.DataFrame], start: int = 0) -> t.Generator[pd.DataFrame, None, None]:
+        """
+        Accumulate observations into batches of ``batch_size`` rows, and yield them
+        canonicalized, numbered consecutively from ``start``, including their provenance.
+        """
+        for batch in iterate_batches(observations, self.batch_size):
+            batch = self.to_canonical("observation", batch)
+            batch.index = pd.RangeIndex(start, start + len(batch), name="id")
+            batch["source"] = "dwd"
+            batch["dataset"] = self.dataset.value
+            batch["partition"] = self.partition.value
+            start += len(batch)
+            yield batch
+
+    # File name extensions of dataset formats, see ``to_dataset``
+    dataset_formats = {
+        "parquet": "parquet",
+        "feather": "arrow",
+    }
+
+    # Columns observations are partitioned by, see ``to_dataset``
+    dataset_partitioning = ["dataset", "partition", "reference_year"]
+
+    def to_dataset(self, path: str, format: str = "parquet", observations: t.Optional[t.Iterable[pd.DataFrame]] = None) -> int:
+        """
+        Export data to a directory of Apache Parquet or Arrow IPC (Feather) files, and
+        return the number of exported observations.
+
+        Dimension tables are written as single files. Observations are written as a
+        Hive-partitioned dataset, so query engines can prune partitions by dataset,
+        partition, and reference year::
+
+            <path>/station.parquet
+            <path>/observation/dataset=annual/partition=recent/reference_year=2023/part-0-0.parquet
+
+        Observations of the same dataset and partition are replaced. When ``observations``
+        is given, observations are streamed from there instead of ``self.observation``,
+        like ``to_sql_observations`` does. Parquet files include row group statistics.
+
+        Needs the ``pyarrow`` package.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if format not in self.dataset_formats:
+            raise ValueError(f'Unknown dataset format "{format}"')
+        extension = self.dataset_formats[format]
+        if format == "parquet":
+            file_format = ds.ParquetFileFormat()
+            file_options = file_format.make_write_options(write_statistics=True)
+        else:
+            file_format = ds.IpcFileFormat()
+            file_options = file_format.make_write_options()
+
+        os.makedirs(path, exist_ok=True)
+        for slot in self.slots:
+            if slot is self.observation:
+                continue
+            table = pa.Table.from_pandas(slot.reset_index(), preserve_index=False)
+            filename = os.path.join(path, f"{slot.attrs['name']}.{extension}")
+            with open(filename, "wb") as f:
+                if format == "parquet":
+                    import pyarrow.parquet as pq
+                    pq.write_table(table, f, write_statistics=True)
+                else:
+                    import pyarrow.feather as feather
+                    feather.write_feather(table, f)
+
+        base_dir = os.path.join(path, "observation")
+        shutil.rmtree(os.path.join(base_dir, f"dataset={self.dataset.value}", f"partition={self.partition.value}"), ignore_errors=True)
+
+        batches = [self.observation] if observations is None else self.iterate_observation_batches(observations)
+        count = 0
+        for number, batch in enumerate(batches):
+            logger.info(f"Writing {len(batch)} observations to {base_dir}")
+            ds.write_dataset(
+                pa.Table.from_pandas(batch.reset_index(), preserve_index=False),
+                base_dir=base_dir,
+                format=file_format,
+                file_options=file_options,
+                partitioning=self.dataset_partitioning,
+                partitioning_flavor="hive",
+                basename_template=f"part-{number}-{{i}}.{extension}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            count += len(batch)
+
+        if not count:
+            logger.warning("No observations found")
+
+        return count
+
+    def to_duckdb(self, path: str, materialize: bool = False, observations: t.Optional[t.Iterable[pd.DataFrame]] = None) -> int:
+        """
+        Export data to DuckDB database file, and return the number of exported observations.
+
+        Instead of going through SQLAlchemy, DataFrames are registered with DuckDB, which
+        scans them directly, and tables are created from them using ``CREATE TABLE AS``.
+        When ``observations`` is given, observations are streamed from there instead of
+        ``self.observation``, like ``to_sql_observations`` does.
+
+        DuckDB prunes data using min/max statistics per row group, so no secondary indexes
+        will be created. ``materialize`` works like with ``to_sql``.
+
+        Needs the ``duckdb`` package.
+        """
+        import duckdb
+
+        connection = duckdb.connect(path)
+        try:
+            existing = connection.execute(
+                "SELECT table_name, table_type FROM information_schema.tables "
+                "WHERE table_name IN ('dwd_phenology', 'dwd_phenology_group')").fetchall()
+            for name, table_type in sorted(existing, reverse=True):
+                connection.execute(f"DROP {'VIEW' if table_type == 'VIEW' else 'TABLE'} {name}")
+            connection.execute(f"DROP TABLE IF EXISTS {self.files_table}")
+
+            def load(frame, table_name, replace=True):
+                connection.register("frame", frame.reset_index())
+                if replace:
+                    connection.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM frame")
+                else:
+                    connection.execute(f"INSERT INTO {table_name} SELECT * FROM frame")
+                connection.unregister("frame")
+
+            for slot in self.slots:
+                if slot is not self.observation:
+                    load(slot, f"dwd_{slot.attrs['name']}")
+
+            batches = [self.observation] if observations is None else self.iterate_observation_batches(observations)
+            count = 0
+            for batch in batches:
+                logger.info(f"Loading {len(batch)} rows into table dwd_observation")
+                load(batch, "dwd_observation", replace=count == 0)
+                count += len(batch)
+            if not count:
+                logger.warning("No observations found")
+                load(self.observation, "dwd_observation")
+
+            for statement in self.create_views_sql(materialize=materialize):
+                connection.execute(statement)
+        finally:
+            connection.close()
+
+        return count
+
+    # Table recording the source files of incremental exports
+    files_table = "dwd_export_file"
+
+    # Columns of the table recording the source files of incremental exports
+    files_columns = ["source", "dataset", "partition", "file", "mtime", "criteria"]
+
+    @classmethod
+    def read_sql_files(cls, dsn: str) -> pd.DataFrame:
+        """
+        Read the source files recorded by ``to_sql_incremental``.
+        """
+        engine = create_engine(dsn)
+        with engine.connect() as connection:
+            if not sa.inspect(connection).has_table(cls.files_table):
+                return pd.DataFrame(columns=cls.files_columns)
+            return pd.read_sql_table(cls.files_table, connection)
+
+    def to_sql_table(self, engine: Engine, frame: pd.DataFrame, table_name: str, bulk: bool = True,
+                     if_exists: str = "replace", fresh: t.Optional[bool] = None, create_indexes: bool = True):
+        """
+        Load DataFrame into database table, using the bulk loader if available.
+
+        When replacing the table, it is created with the same schema on both paths,
+        see ``to_sql_create_table``, and its secondary indexes are created after
+        loading, unless ``create_indexes`` is false. See ``to_sql_bulk`` about ``fresh``.
+        """
+        replace = if_exists == "replace"
+        if replace:
+            keys = self.to_sql_create_table(engine, frame, table_name)
+        if bulk and self.get_bulk_loader(engine):
+            self.to_sql_bulk(engine, frame, table_name, fresh=replace if fresh is None else fresh)
+        else:
+            frame.to_sql(name=table_name, con=engine, if_exists="append", chunksize=self.chunksize)
+        if replace:
+            # Otherwise, same index as created by ``DataFrame.to_sql``
+            if not keys:
+                self.to_sql_create_indexes(engine, table_name, self.index_labels(frame))
+            if create_indexes:
+                self.to_sql_create_indexes(engine, table_name)
+
+    def to_sql_create_table(self, engine: Engine, frame: pd.DataFrame, table_name: str) -> t.Optional[t.List[str]]:
+        """
+        Create database table for DataFrame, replacing an existing one, and return its primary key columns.
+
+        The table schema is computed by pandas, like when using ``DataFrame.to_sql``.
+        When the index is unique, it will become the primary key of the table.
+        """
+        quote = engine.dialect.identifier_preparer.quote
+        keys = self.index_labels(frame) if frame.index.is_unique else None
+        with engine.connect() as connection:
+            connection.execute(sa.text(f"DROP TABLE IF EXISTS {quote(table_name)}"))
+            connection.execute(sa.text(pd.io.sql.get_schema(frame.reset_index(), table_name, keys=keys, con=connection)))
+            connection.commit()
+        return keys
+
+    @staticmethod
+    def index_labels(frame: pd.DataFrame) -> t.List[str]:
+        return [name or "index" for name in frame.index.names]
+
+    def to_sql_bulk(self, engine: Engine, frame: pd.DataFrame, table_name: str, fresh: bool = True):
+        """
+        Load DataFrame into existing database table, bypassing SQLAlchemy's parameter binding.
+
+        Rows are loaded by the dialect-specific bulk loader, see ``bulk_loaders``.
+        ``fresh`` signals the table has been created by the current export, so the
+        loader does not need to protect existing data.
+        """
+        logger.info(f"Loading {len(frame)} rows into table {table_name}")
+        quote = engine.dialect.identifier_preparer.quote
+        frame = frame.reset_index()
+        columns = ", ".join(map(quote, frame.columns))
+
+        raw_connection = engine.raw_connection()
+        try:
+            loader = self.get_bulk_loader(engine)
+            loader(raw_connection.driver_connection, frame, quote(table_name), columns, fresh=fresh)
+        finally:
+            raw_connection.close()
+
+    # Bulk loader method names, by SQLAlchemy dialect and driver name
+    bulk_loaders = {
+        "sqlite+pysqlite": "load_sqlite",
+        "postgresql+psycopg2": "load_postgresql",
+        "postgresql+psycopg": "load_postgresql",
+    }
+
+    def get_bulk_loader(self, engine: Engine) -> t.Optional[t.Callable]:
+        name = self.bulk_loaders.get(f"{engine.dialect.name}+{engine.dialect.driver}")
+        return name and getattr(self, name)
+
+    def load_sqlite(self, connection, frame: pd.DataFrame, table: str, columns: str, fresh: bool = True):
+        """
+        Load rows into SQLite table within a single transaction, using ``executemany``.
+
+        When loading into a fresh table, journaling and synchronous writes are turned
+        off. The table is written from scratch, so there is nothing to roll back to.
+        """
+        cursor = connection.cursor()
+        journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+        if fresh:
+            cursor.execute("PRAGMA journal_mode=OFF")
+            cursor.execute("PRAGMA synchronous=OFF")
+        try:
+            placeholders = ", ".join("?" * len(frame.columns))
+            statement = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+            for records in iterate_records(frame, self.chunksize):
+                cursor.executemany(statement, records)
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.close()
+
+    def load_postgresql(self, connection, frame: pd.DataFrame, table: str, columns: str, fresh: bool = True):
+        """
+        Load rows into PostgreSQL table using ``COPY FROM STDIN``, in CSV format.
+
+        Supports both the ``psycopg2`` and the ``psycopg`` (version 3) drivers.
+        """
+        statement = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        cursor = connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):
+                for start in range(0, len(frame), self.chunksize):
+                    buffer = io.StringIO(frame.iloc[start:start + self.chunksize].to_csv(header=False, index=False))
+                    cursor.copy_expert(statement, buffer)
+            else:
+                with cursor.copy(statement) as copy:
+                    for start in range(0, len(frame), self.chunksize):
+                        copy.write(frame.iloc[start:start + self.chunksize].to_csv(header=False, index=False))
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def to_sql_create_indexes(self, engine: Engine, table_name: str, columns: t.Optional[t.List[str]] = None):
+        """
+        Create an index for each of the designated columns, defaulting to the secondary indexes of the table.
+        """
+        quote = engine.dialect.identifier_preparer.quote
+        with engine.connect() as connection:
+            if columns is None:
+                existing = [column["name"] for column in sa.inspect(connection).get_columns(table_name)]
+                columns = [column for column in self.indexes.get(table_name, []) if column in existing]
+            for column in columns:
+                index_name = quote(f"ix_{table_name}_{column}")
+                connection.execute(sa.text(f"CREATE INDEX {index_name} ON {quote(table_name)} ({quote(column)})"))
+            connection.commit()
+
+    @classmethod
+    def to_sql_drop_views(cls, connection: sa.Connection):
+        """
+        Drop ``dwd_phenology`` and ``dwd_phenology_group``, either views or materialized tables,
+        and the full text search views and tables, see ``to_sql_create_fulltext``.
+        """
+        inspector = sa.inspect(connection)
+        views = inspector.get_view_names()
+        names = ["dwd_phenology_group", "dwd_phenology"]
+        for name in cls.fulltext_columns:
+            names += [f"dwd_{name}_search", f"dwd_{name}_fts"]
+        for name in names:
+            if name in views:
+                connection.execute(sa.text(f"DROP VIEW {name}"))
+            elif inspector.has_table(name):
+                connection.execute(sa.text(f"DROP TABLE {name}"))
+
+    # Columns indexed for full text search, by dimension table, see ``to_sql_create_fulltext``
+    fulltext_columns = {
+        "station": ["station_name", "area_group", "area", "state"],
+        "species": ["species_name_de", "species_name_en", "species_name_la"],
+        "phase": ["phase_name_de", "phase_name_en"],
+    }
+
+    def to_sql_create_fulltext(self, engine: Engine):
+        """
+        Index names of stations, species, and phases for full text search.
+
+        For each dimension table, like ``dwd_station``, create the ``dwd_station_search``
+        view, joining its rows with the full text index through the ``search`` column:
+
+        - On SQLite, the index is an FTS5 virtual table ``dwd_station_fts``, ignoring
+          diacritics. Query it like ``WHERE search MATCH 'munchen'``, and sort by ``rank``.
+        - On PostgreSQL, the index is a GIN index on the ``tsvector`` column of the
+          ``dwd_station_fts`` table. Query it like ``WHERE search @@ websearch_to_tsquery('simple', 'münchen')``.
+
+        Other databases are not supported.
+        """
+        if engine.dialect.name not in ["sqlite", "postgresql"]:
+            logger.warning(f"Full text search is not supported on {engine.dialect.name}")
+            return
+
+        with engine.connect() as connection:
+            inspector = sa.inspect(connection)
+            for name, columns in self.fulltext_columns.items():
+                table, fts, view = f"dwd_{name}", f"dwd_{name}_fts", f"dwd_{name}_search"
+                existing = [column["name"] for column in inspector.get_columns(table)]
+                columns = [column for column in columns if column in existing]
+                if engine.dialect.name == "sqlite":
+                    connection.execute(sa.text(f"""
+                        CREATE VIRTUAL TABLE {fts} USING fts5(
+                            id UNINDEXED, {", ".join(columns)}, tokenize="unicode61 remove_diacritics 2")"""))
+                    connection.execute(sa.text(f"INSERT INTO {fts} SELECT id, {', '.join(columns)} FROM {table}"))
+                    connection.execute(sa.text(f"""
+                        CREATE VIEW {view} AS
+                        SELECT {fts}.{fts} AS search, {fts}.rank AS rank, {table}.*
+                        FROM {fts} JOIN {table} ON {table}.id = {fts}.id"""))
+                else:
+                    connection.execute(sa.text(f"""
+                        CREATE TABLE {fts} AS
+                        SELECT id, to_tsvector('simple', concat_ws(' ', {", ".join(columns)})) AS search
+                        FROM {table}"""))
+                    connection.execute(sa.text(f"CREATE INDEX ix_{fts}_search ON {fts} USING GIN (search)"))
+                    connection.execute(sa.text(f"""
+                        CREATE VIEW {view} AS
+                        SELECT {fts}.search, {table}.*
+                        FROM {fts} JOIN {table} ON {table}.id = {fts}.id"""))
+            connection.commit()
+
+    @staticmethod
+    def to_sql_analyze(engine: Engine):
+        """
+        Gather statistics about tables and indexes, for the query planner.
+        """
+        if engine.dialect.name not in ["sqlite", "postgresql"]:
+            return
+        with engine.connect() as connection:
+            connection.execute(sa.text("ANALYZE"))
+            connection.commit()
+
+    def to_sql_create_views(self, engine: Engine, materialize: bool = False):
+        """
+        Define views on top of physical tables.
+
+        When ``materialize`` is true, create denormalized tables instead, including
+        secondary indexes, so queries do not need to evaluate the joins.
+        """
+        with engine.connect() as connection:
+            self.to_sql_drop_views(connection)
+            connection.commit()
+            for statement in self.create_views_sql(materialize=materialize):
+                connection.execute(sa.text(statement))
+            connection.commit()
+
+        if materialize:
+            self.to_sql_create_indexes(engine, "dwd_phenology")
+            self.to_sql_create_indexes(engine, "dwd_phenology_group")
+
+    @staticmethod
+    def create_views_sql(materialize: bool = False) -> t.List[str]:
+        """
+        SQL statements creating the ``dwd_phenology`` and ``dwd_phenology_group`` views,
+        or tables when ``materialize`` is true.
+        """
+        kind = "TABLE" if materialize else "VIEW"
+        return [f"""
+CREATE {kind} dwd_phenology AS
    SELECT
       dwd_observation.id as observation_id,
       dwd_observation.source,
@@ -207,15 +738,49 @@ CREATE VIEW dwd_phenology AS
       AND dwd_observation.quality_level_id=dwd_quality_level.id
       AND dwd_observation.quality_byte_id=dwd_quality_byte.id
     ORDER BY reference_year, day_of_year
-    ;"""))
-
-            connection.execute(sa.text("""
-CREATE VIEW dwd_phenology_group AS
-    SELECT *
+    ;""", f"""
+CREATE {kind} dwd_phenology_group AS
+    SELECT dwd_phenology.*, dwd_species_group.group_name
     FROM
         dwd_phenology, dwd_species_group
     WHERE true
         AND dwd_phenology.species_id=dwd_species_group.species_id
     ORDER BY reference_year, day_of_year;
-            """))
-            connection.commit()
+            """]
+
+
+def iterate_records(frame: pd.DataFrame, batch_size: int) -> t.Generator[t.List[t.Tuple], None, None]:
+    """
+    Convert DataFrame into batches of rows, each row being a tuple of native Python values.
+
+    Missing values will be converted to ``None``. Timestamps will be converted to
+    strings, using the same format as SQLAlchemy's ``DateTime`` type on SQLite.
+    """
+    for start in range(0, len(frame), batch_size):
+        batch = frame.iloc[start:start + batch_size]
+        columns = []
+        for name in batch.columns:
+            values = batch[name]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = values.dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+            columns.append(values.astype(object).where(batch[name].notna(), None).tolist())
+        yield list(zip(*columns))
+
+
+def iterate_batches(frames: t.Iterable[pd.DataFrame], batch_size: int) -> t.Generator[pd.DataFrame, None, None]:
+    """
+    Accumulate DataFrames into batches of at least ``batch_size`` rows, and yield them concatenated.
+    """
+    pending = []
+    size = 0
+    for frame in frames:
+        if frame is None or frame.empty:
+            continue
+        pending.append(frame)
+        size += len(frame)
+        if size >= batch_size:
+            yield pd.concat(pending, ignore_index=True)
+            pending = []
+            size = 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
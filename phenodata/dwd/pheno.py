@@ -2,16 +2,160 @@
 # (c) 2018-2023, The Earth Observations Developers
 from __future__ import print_function
 import attr
+import functools
+import hashlib
+import importlib.resources
 import json
 import logging
+import os
+import threading
+import numpy as np
 import pandas as pd
-import pkg_resources
 from datetime import datetime
-from phenodata.util import haversine_distance, iterate_with_progressbar
+from phenodata.util import SpatialIndex, TextSearchIndex, day_of_year_to_date, iterate_with_progressbar, to_list
 
 logger = logging.getLogger(__name__)
 
 
+class DimensionTableRegistry:
+    """
+    Keep parsed dimension tables (stations, species, phases, quality levels and bytes)
+    in memory, so each CSV file will only be parsed once per process.
+
+    Before handing out a table, its modification time on the FTP server will be checked,
+    in order to re-read it when it changed. This is cheap, because ``FTPSession.mtime``
+    uses cached directory listings.
+
+    Tables are handed out as shallow copies, sharing their data with the registry.
+    Adding, removing, or renaming columns and index levels is fine, but values must
+    not be modified in place.
+
+    Objects derived from a table, like search indexes, can be memoized alongside,
+    see ``derive``. They will be discarded when the table is re-read.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.lock = threading.RLock()
+
+    def get(self, cdc, path, index_column=None) -> pd.DataFrame:
+        return self.view(self.refresh(cdc, path, index_column=index_column)[1])
+
+    def derive(self, cdc, path, name, factory, index_column=None):
+        """
+        Return object computed by ``factory``, once per version of the table at ``path``.
+        """
+        with self.lock:
+            mtime, frame, derived = self.refresh(cdc, path, index_column=index_column)
+            if name not in derived:
+                derived[name] = factory()
+            return derived[name]
+
+    def refresh(self, cdc, path, index_column=None):
+        url = cdc.baseurl + path
+        mtime = cdc.ftp.mtime(url)
+        with self.lock:
+            entry = self.tables.get(url)
+            if entry is None or entry[0] != mtime:
+                frame = cdc.get_dataframe(url=url, index_column=index_column)
+                entry = self.tables[url] = (mtime, frame, {})
+        return entry
+
+    @staticmethod
+    def view(frame: pd.DataFrame) -> pd.DataFrame:
+        view = frame.copy(deep=False)
+        view.index = view.index.copy()
+        return view
+
+
+@attr.s
+class ResultCache:
+    """
+    Keep results of observation queries on disk, as Parquet files.
+
+    Entries are keyed by a hash of the query options, and the modification times
+    of all source files, see ``DwdPhenoDataClient.get_observations_key``. So, they
+    never need to be invalidated explicitly. When the total size of all entries
+    exceeds ``max_size`` bytes, the least recently used ones will be evicted.
+
+    Writing Parquet files needs the ``pyarrow`` package.
+    """
+
+    # Path to cache directory
+    path = attr.ib()
+
+    # Maximum total size of all entries in bytes
+    max_size = attr.ib(default=512 * 1024 * 1024)
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Compute canonical hash of JSON-serializable ``parts``.
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, f'{key}.parquet')
+
+    def get(self, key):
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+        try:
+            frame = pd.read_parquet(filename)
+        except Exception as ex:
+            logger.warning(f'Reading result cache entry "{filename}" failed: {ex}')
+            self.remove(filename)
+            return None
+
+        # Mark entry as recently used
+        os.utime(filename)
+        return frame
+
+    def set(self, key, frame):
+        os.makedirs(self.path, exist_ok=True)
+        filename = self.filename(key)
+
+        # Write to temporary file first, so concurrent readers will never see partial files
+        tempfile = f'{filename}.{os.getpid()}.tmp'
+        try:
+            frame.to_parquet(tempfile)
+        except Exception as ex:
+            logger.warning(f'Writing result cache entry "{filename}" failed: {ex}')
+            self.remove(tempfile)
+            return
+        os.replace(tempfile, filename)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries, until the total size is within ``max_size``.
+        """
+        entries = []
+        with os.scandir(self.path) as iterator:
+            for entry in iterator:
+                if entry.name.endswith('.parquet'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            logger.info(f'Evicting result cache entry "{filename}"')
+            self.remove(filename)
+            total -= size
+
+    @staticmethod
+    def remove(filename):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+
 @attr.s
 class DwdPhenoDataClient:
     """
@@ -41,6 +185,32 @@ class DwdPhenoDataClient:
     # Instance of ``phenodata.dwd.pheno.DwdPhenoDataHumanizer``
     humanizer = attr.ib(default=None)
 
+    # Instance of ``phenodata.dwd.pheno.DimensionTableRegistry``
+    dimensions = attr.ib(default=attr.Factory(DimensionTableRegistry))
+
+    # Optional instance of ``phenodata.dwd.pheno.ResultCache``
+    results = attr.ib(default=None)
+
+    # Optional instance of ``phenodata.dwd.warehouse.DwdPhenoWarehouse``, to read observations from
+    store = attr.ib(default=None)
+
+    # Map ID-based criteria to the observation columns they apply to, see ``filter_by_ids``
+    isin_map = {
+        'year': 'Referenzjahr',
+        'quality-level': 'Qualitaetsniveau',
+        'quality-byte': 'Eintrittsdatum_QB',
+        'station-id': 'Stations_id',
+        'species-id': 'Objekt_id',
+        'phase-id': 'Phase_id',
+    }
+
+    # Options influencing the result of ``get_observations``, see ``get_observations_key``
+    observation_options = [
+        'partition', 'filename', 'year',
+        'quality-level', 'quality-byte', 'station-id', 'species-id', 'phase-id',
+        'quality', 'station', 'species', 'phase',
+    ]
+
     @property
     def data_directory(self):
         """
@@ -52,7 +222,7 @@ class DwdPhenoDataClient:
         """
         Return DataFrame with species information
         """
-        df: pd.DataFrame = self.cdc.get_dataframe(path='/help/PH_Beschreibung_Pflanze.txt', index_column=0)
+        df: pd.DataFrame = self.dimensions.get(self.cdc, '/help/PH_Beschreibung_Pflanze.txt', index_column=0)
         df.attrs["name"] = "species"
         return df
 
@@ -60,7 +230,7 @@ class DwdPhenoDataClient:
         """
         Return DataFrame with phases information
         """
-        df = self.cdc.get_dataframe(path='/help/PH_Beschreibung_Phase.txt', index_column=0)
+        df = self.dimensions.get(self.cdc, '/help/PH_Beschreibung_Phase.txt', index_column=0)
         df.attrs["name"] = "phase"
         return df
 
@@ -68,7 +238,7 @@ class DwdPhenoDataClient:
         """
         Return DataFrame with quality level information
         """
-        df = self.cdc.get_dataframe(path='/help/PH_Beschreibung_Phaenologie_Qualitaetsniveau.txt', index_column=0)
+        df = self.dimensions.get(self.cdc, '/help/PH_Beschreibung_Phaenologie_Qualitaetsniveau.txt', index_column=0)
         df.attrs["name"] = "quality_level"
         return df
 
@@ -77,93 +247,184 @@ class DwdPhenoDataClient:
         Return DataFrame with quality bytes information
         ftp://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/subdaily/standard_format/qualitaetsbytes.pdf
         """
-        df = self.cdc.get_dataframe(path='/help/PH_Beschreibung_Phaenologie_Qualitaetsbyte.txt', index_column=0)
+        df = self.dimensions.get(self.cdc, '/help/PH_Beschreibung_Phaenologie_Qualitaetsbyte.txt', index_column=0)
         df.attrs["name"] = "quality_byte"
         return df
 
-    def get_stations(self, filter=None, all=False):
+    # Fields of the stations list to be searched by text
+    station_search_fields = ['Stationsname', 'Naturraumgruppe', 'Naturraum', 'Bundesland']
+
+    @property
+    def stations_path(self):
         """
-        Return DataFrame with stations information.
+        Location of stations information on the FTP server
         """
-
         if self.dataset == 'immediate':
-            filename = '/help/PH_Beschreibung_Phaenologie_Stationen_Sofortmelder.txt'
+            return '/help/PH_Beschreibung_Phaenologie_Stationen_Sofortmelder.txt'
         elif self.dataset == 'annual':
-            filename = '/help/PH_Beschreibung_Phaenologie_Stationen_Jahresmelder.txt'
+            return '/help/PH_Beschreibung_Phaenologie_Stationen_Jahresmelder.txt'
         else:
             raise KeyError('Unknown dataset "{}"'.format(self.dataset))
 
-        # Read stations CSV file
-        data = self.cdc.get_dataframe(path=filename, index_column=0)
+    def get_stations(self, filter=None, all=False, match='substring'):
+        """
+        Return DataFrame with stations information.
+
+        Optionally filter by text, see ``find_stations``.
+        """
 
-        # Unless "all==True", use only rows with "Datum Stationsaufloesung" == nan
-        if not all:
-            data = data[data['Datum Stationsaufloesung'].isna()]
+        if filter:
+            stations, index = self.get_station_search_index(all=all)
+            data = stations.iloc[index.search(filter, mode=match)]
 
-        # Appropriately coerce geolocation values to float
-        #dataframe_coerce_columns(data, ['geograph.Breite', 'geograph.Laenge'], float)
+        else:
+            # Read stations CSV file
+            data = self.dimensions.get(self.cdc, self.stations_path, index_column=0)
 
-        # A. Basic filtering
+            # Unless "all==True", use only rows with "Datum Stationsaufloesung" == nan
+            if not all:
+                data = data[data['Datum Stationsaufloesung'].isna()]
 
-        if filter:
-            # Build "boolean indexing" filter expression from multiple ID-based criteria
-            # https://pandas.pydata.org/pandas-docs/stable/indexing.html#boolean-indexing
-            reference_fields = [
-                'Stationsname',
-                'Naturraumgruppe',
-                'Naturraum',
-                'Bundesland',
-            ]
-
-            expression = False
-            for reference_field in reference_fields:
-                #print(reference_field, filter)
-                expression |= data[reference_field].str.contains(filter, case=False)
-
-            # Apply filter expression to DataFrame
-            if type(expression) is not bool:
-                data = data[expression]
+        # Appropriately coerce geolocation values to float
+        #dataframe_coerce_columns(data, ['geograph.Breite', 'geograph.Laenge'], float)
 
         data.attrs["name"] = "station"
 
         return data
 
+    def find_stations(self, patterns, all=False, match='substring'):
+        """
+        Return identifiers of stations matching any of the text patterns.
+
+        Patterns are matched against the fields ``Stationsname``, ``Naturraumgruppe``,
+        ``Naturraum``, and ``Bundesland``, using the search modes "substring",
+        "prefix", or "fuzzy", see ``phenodata.util.TextSearchIndex``.
+        """
+        stations, index = self.get_station_search_index(all=all)
+        positions = np.unique(np.concatenate([index.search(pattern, mode=match) for pattern in to_list(patterns)]))
+        return stations.index[positions]
+
+    def get_station_search_index(self, all=False):
+        """
+        Return stations, and text search index over their names and regions.
+        Both are computed once per version of the stations list.
+        """
+        def factory():
+            stations = self.get_stations(all=all)
+            index = TextSearchIndex(stations, self.station_search_fields)
+            return stations, index
+        return self.dimensions.derive(self.cdc, self.stations_path, ('search-index', all), factory, index_column=0)
+
     def nearest_station(self, latitude, longitude, all=False):
         """
         Select closest station.
         """
         return self.nearest_stations(latitude, longitude, all=all).head(1)
 
-    def nearest_stations(self, latitude, longitude, all=False, limit=10):
+    def nearest_stations(self, latitude, longitude, all=False, limit=10, radius=None):
         """
         Select closest stations.
 
+        Optionally obtains ``radius`` parameter, the maximum distance in meters.
+
         Stolen from https://github.com/marians/dwd-weather
         """
 
-        # Retrieve stations
-        stations = self.get_stations(all=all)
+        stations, index = self.get_spatial_index(all=all)
+
+        # Find nearest stations, sorted ascending by distance value
+        positions, distances = index.query([latitude], [longitude], k=limit)
+
+        # Select stations and insert distances as new column
+        frame = stations.iloc[positions[0]]
+        frame.insert(1, 'Distanz', distances[0])
+
+        if radius is not None:
+            frame = frame[frame['Distanz'] <= radius]
+
+        return frame
+
+    def nearest_stations_batch(self, points, all=False, limit=10, radius=None):
+        """
+        Select closest stations for many positions at once.
+
+        ``points`` is a sequence of ``(latitude, longitude)`` tuples. The result has
+        up to ``limit`` rows per position, indexed by the position's sequence number
+        ``Punkt``. Optionally obtains ``radius`` parameter, the maximum distance in meters.
+        """
 
-        # Build list of distances to corresponding station
-        distances = []
-        for index, station in stations.iterrows():
-            distance = haversine_distance(
-                (longitude, latitude),
-                (station['geograph.Laenge'], station['geograph.Breite'])
-            )
-            distances.append(distance)
+        stations, index = self.get_spatial_index(all=all)
 
-        # Insert list of distances as new column
-        stations.insert(1, 'Distanz', distances)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        positions, distances = index.query(points[:, 0], points[:, 1], k=limit)
+        point_numbers = np.repeat(np.arange(len(points)), positions.shape[1])
 
-        # Sort ascending by distance value and limit row count
-        stations = stations.sort_values('Distanz').head(n=limit)
+        # Select stations and insert positions and distances as new columns
+        frame = stations.iloc[positions.ravel()].reset_index()
+        frame.insert(0, 'Punkt', point_numbers)
+        frame.insert(1, 'Punkt.Breite', points[point_numbers, 0])
+        frame.insert(2, 'Punkt.Laenge', points[point_numbers, 1])
+        frame.insert(5, 'Distanz', distances.ravel())
+        frame = frame.set_index('Punkt')
+        frame.attrs["name"] = "station"
 
-        # Convert Series to DataFrame again
-        frame = pd.DataFrame(stations)
+        if radius is not None:
+            frame = frame[frame['Distanz'] <= radius]
 
         return frame
 
+    def nearest_stations_stream(self, frames, all=False, limit=10, radius=None):
+        """
+        Select closest stations for positions from a stream of DataFrames.
+
+        For each DataFrame of positions, yield a DataFrame of the nearest stations,
+        see ``nearest_stations_batch``. Positions are read from the ``latitude`` and
+        ``longitude`` columns, or ``lat`` and ``lon``, or the first two columns. Other
+        columns are passed through. The stations list is only read once.
+
+        Raises ``ValueError`` for input rows with missing or non-finite coordinates.
+        """
+        offset = 0
+        for frame in frames:
+            columns = {column.lower(): column for column in frame.columns}
+            if 'latitude' in columns and 'longitude' in columns:
+                latitude, longitude = columns['latitude'], columns['longitude']
+            elif 'lat' in columns and 'lon' in columns:
+                latitude, longitude = columns['lat'], columns['lon']
+            else:
+                latitude, longitude = frame.columns[:2]
+
+            points = frame[[latitude, longitude]].to_numpy(dtype=float)
+            invalid = ~np.isfinite(points).all(axis=1)
+            if invalid.any():
+                rows = ', '.join(map(str, offset + np.flatnonzero(invalid)[:10]))
+                raise ValueError(f'Invalid position in input rows {rows}: '
+                                 f'Columns "{latitude}" and "{longitude}" must be finite numbers')
+
+            result = self.nearest_stations_batch(points, all=all, limit=limit, radius=radius)
+
+            # Prepend pass-through columns of input data
+            passthrough = frame.drop(columns=[latitude, longitude]).iloc[result.index.to_numpy()]
+            result = pd.concat([passthrough.set_axis(result.index), result], axis=1)
+
+            # Number positions across all DataFrames
+            result.index = result.index + offset
+            offset += len(frame)
+
+            yield result
+
+    def get_spatial_index(self, all=False):
+        """
+        Return stations, and spatial index over their geographic positions.
+        Both are computed once per version of the stations list, and kept in
+        memory. The stations list itself is persisted by the FTP cache.
+        """
+        def factory():
+            stations = self.get_stations(all=all)
+            index = SpatialIndex(stations['geograph.Breite'], stations['geograph.Laenge'])
+            return stations, index
+        return self.dimensions.derive(self.cdc, self.stations_path, ('spatial-index', all), factory, index_column=0)
+
     def get_observations(self, options, humanize=False):
         """
         Retrieve observations.
@@ -171,10 +432,26 @@ class DwdPhenoDataClient:
         - Obtain query options
         - Compute DataFrame with combined observation data
         - Apply a bunch of filters to the result data
+
+        When ``self.results`` is a ``ResultCache``, results will be served from there,
+        as long as none of the source files changed. It is not used when reading
+        observations from ``self.store``.
         """
 
-        # Acquire data
-        observations = self.query(partition=options['partition'], files=options.get('filename'))
+        paths = None
+        cache_key = None
+        if self.results is not None and self.store is None:
+            entries = self.scan_files(options['partition'], include=options.get('filename'))
+            cache_key = self.get_observations_key(options, entries, humanize=humanize)
+            observations = self.results.get(cache_key)
+            if observations is not None:
+                logger.info('Loading observations from result cache')
+                observations.attrs["name"] = "observation"
+                return observations
+            paths = [entry['url'] for entry in entries]
+
+        # Acquire data, already applying ID-based criteria while reading each file
+        observations = self.query(partition=options['partition'], files=options.get('filename'), criteria=options, paths=paths)
 
         # Sanity checks
         if observations is None:
@@ -193,10 +470,48 @@ class DwdPhenoDataClient:
             megaframe = self.create_megaframe(observations)
             observations = self.humanizer.get_observations(megaframe)
 
+        if cache_key is not None:
+            self.results.set(cache_key, observations)
+
         observations.attrs["name"] = "observation"
 
         return observations
 
+    def get_observations_key(self, options, entries, humanize=False):
+        """
+        Compute cache key for the result of ``get_observations``.
+
+        It covers the relevant query options, independently of the order of list items,
+        the modification times of the observation files listed in ``entries``, as
+        returned by ``scan_files``, and the modification times of the dimension tables.
+        """
+        criteria = self.get_observations_criteria(options)
+
+        dimension_paths = [
+            self.stations_path,
+            '/help/PH_Beschreibung_Pflanze.txt',
+            '/help/PH_Beschreibung_Phase.txt',
+            '/help/PH_Beschreibung_Phaenologie_Qualitaetsniveau.txt',
+            '/help/PH_Beschreibung_Phaenologie_Qualitaetsbyte.txt',
+        ]
+        sources = sorted((entry['url'], str(entry['mtime'])) for entry in entries)
+        sources += [(path, str(self.cdc.ftp.mtime(self.cdc.baseurl + path))) for path in dimension_paths]
+
+        humanizer = attr.asdict(self.humanizer) if humanize else None
+
+        return self.results.make_key(self.dataset, criteria, humanizer, sources)
+
+    def get_observations_criteria(self, options):
+        """
+        Normalize the query options relevant to ``get_observations``, independently of the order of list items.
+        """
+        criteria = {}
+        for key in self.observation_options:
+            value = options.get(key)
+            if value:
+                criteria[key] = sorted(map(str, to_list(value)))
+        return criteria
+
     def get_forecast(self, options, forecast_year=None, humanize=False):
         """
         Forecast observations.
@@ -205,12 +520,15 @@ class DwdPhenoDataClient:
         - Get real observations, all filtering options can be used
         - Group results by (Stations_id, Objekt_id, Phase_id)
         - Aggregate mean "day of the year" value of the "Jultag" values for each group
+        - Compute dates for each target year, sharing the same aggregation
+
+        The ``forecast_year`` parameter accepts a single year, or a list of years.
         """
 
-        # Compute target year.
-        target_year = datetime.today().year
-        if forecast_year is not None:
-            target_year = datetime.strptime(str(forecast_year), "%Y").year
+        # Compute target years.
+        target_years = [datetime.strptime(str(year), "%Y").year for year in to_list(forecast_year or [])]
+        if not target_years:
+            target_years = [datetime.today().year]
 
         # Get current observations
         observations = self.get_observations(options)
@@ -226,42 +544,37 @@ class DwdPhenoDataClient:
         # Aggregate mean "day of the year" value of the "Jultag" values for each group
         series = grouped['Jultag'].mean().round().astype(int)
 
-        # Convert Series to DataFrame
-        forecast = series.to_frame()
+        frames = []
+        for target_year in target_years:
+
+            # Convert Series to DataFrame
+            forecast = series.to_frame()
 
+            # Compute ISO date from "day of the year" values and insert as new column
+            forecast.insert(0, 'Datum', day_of_year_to_date(target_year, forecast['Jultag']))
 
-        # Compute ISO date from "day of the year" values and insert as new column
-        real_dates = pd.to_datetime(target_year * 1000 + forecast['Jultag'], errors='coerce', format='%Y%j')
-        forecast.insert(0, 'Datum', real_dates)
+            # Resolve index column to real columns
+            for level in forecast.index.names:
+                forecast[level] = forecast.index.get_level_values(level)
 
-        # Resolve index column to real columns
-        station_ids = []
-        species_ids = []
-        phase_ids = []
-        for index, row in forecast.iterrows():
-            # Decode index column and collect its components
-            station_id, species_id, phase_id = index
-            station_ids.append(station_id)
-            species_ids.append(species_id)
-            phase_ids.append(phase_id)
+            # Remember target year for humanizing, and to tell apart rows of multiple target years
+            if humanize or len(target_years) > 1:
+                forecast.insert(0, 'Referenzjahr', target_year)
 
-        forecast['Stations_id'], forecast['Objekt_id'], forecast['Phase_id'] = station_ids, species_ids, phase_ids
+            frames.append(forecast)
 
+        forecast = pd.concat(frames, sort=False)
 
         # Optionally humanize DataFrame
         if humanize:
-            megaframe = self.create_megaframe(forecast, drop_index_columns=True)
-            forecast = self.humanizer.get_forecast(megaframe, target_year=target_year)
-
-        # or pass-through with minor cosmetic amendments
-        else:
-            forecast['Datum'] = forecast['Datum'].astype(str)
+            megaframe = self.create_megaframe(forecast.reset_index(drop=True))
+            forecast = self.humanizer.get_forecast(megaframe, target_year=megaframe['Referenzjahr'])
 
         forecast.attrs["name"] = "forecast"
 
         return forecast
 
-    def query(self, partition=None, files=None):
+    def query(self, partition=None, files=None, criteria=None, paths=None):
         """
         The FTP/pandas workhorse, converges data from multiple observation data
         CSV files on upstream CDC FTP server into a single pandas DataFrame object.
@@ -269,45 +582,100 @@ class DwdPhenoDataClient:
         - Obtains ``partition`` parameter which can be either ``annual`` or ``immediate``.
         - Obtains optional ``files`` parameter which will be applied
           as an "include" filter to the list of scanned file names.
+        - Obtains optional ``criteria`` parameter. Its ID-based filter criteria
+          will be applied to each file before accumulating the results, see
+          ``filter_by_ids``.
+        - Obtains optional ``paths`` parameter, the list of file URLs to read.
+          When given, scanning the FTP server will be skipped.
+
+        The acquisition is a staged pipeline: ``read_files`` parses and reduces
+        each file individually, ``concat_files`` combines all of them at once.
+
+        When ``self.store`` is a ``DwdPhenoWarehouse``, observations will be read
+        from there instead, see ``read_store``.
         """
 
-        logger.info('Scanning for files')
+        if self.store is not None:
+            frames = list(self.read_store(partition, files=files, criteria=criteria))
+            if not frames:
+                logger.info('Querying store returned empty results')
+                return
+            return self.concat_files(frames)
 
-        # Search FTP server
-        paths = self.scan_files(partition, include=files, field='url')
+        if paths is None:
+            logger.info('Scanning for files')
 
-        logger.info('Starting data acquisition with {} files'.format(len(paths)))
+            # Search FTP server
+            paths = self.scan_files(partition, include=files, field='url')
 
-        # The main DataFrame object
-        results = pd.DataFrame()
+        logger.info('Starting data acquisition with {} files'.format(len(paths)))
 
         # Load multiple files into single DataFrame
-        for path in iterate_with_progressbar(paths):
+        frames = list(self.read_files(paths, criteria=criteria, desc=f'{self.dataset}/{partition}'))
 
-            logger.debug('Processing file "{}"'.format(path))
+        # Sanity checks
+        if not frames:
+            logger.info('Querying DWD CDC returned empty results')
+            return
+
+        return self.concat_files(frames)
+
+    def read_files(self, paths, criteria=None, desc=None):
+        """
+        Read observation data CSV files one by one, and yield a DataFrame for each.
+
+        Optionally obtains ``criteria`` parameter. Its ID-based filter criteria will
+        be applied right away, so only matching rows will be retained in memory.
+        Optionally obtains ``desc`` parameter, used as label of the progress bar.
+        """
+        # Acquire DataFrames from CSV data
+        for path, data in iterate_with_progressbar(self.cdc.get_dataframes(paths, coerce_int=True), total=len(paths), desc=desc):
 
-            # Acquire DataFrame from CSV data
-            data = self.cdc.get_dataframe(path, coerce_int=True)
+            logger.debug('Processing file "{}"'.format(path))
 
             # Sanity checks
-            if data is None:
-                logger.warning('File "{}" is empty')
+            if data is None or data.empty:
+                logger.warning('File "{}" is empty'.format(path))
                 continue
 
-            # Coerce "Eintrittsdatum" column into date format
-            data['Eintrittsdatum'] = pd.to_datetime(data['Eintrittsdatum'], errors='coerce', format='%Y%m%d')
+            # Reduce data early, so that memory usage scales with the size of the result
+            if criteria:
+                data = self.filter_by_ids(data, criteria)
 
-            results = pd.concat([results, data], sort=False)
+            yield data
 
-        # Sanity checks
-        if results.empty:
-            logger.info('Querying DWD CDC returned empty results')
-            return
+    def read_store(self, partition, files=None, criteria=None):
+        """
+        Read observation data from local store, and yield a DataFrame for each source file.
+
+        Optionally obtains ``criteria`` parameter, like ``read_files``.
+        """
+        logger.info('Reading observations from store at {}'.format(self.store.path))
+        for data in self.store.read_frames(self.dataset, partition, include=files):
+            if criteria:
+                data = self.filter_by_ids(data, criteria)
+            yield data
 
-        # Reset index column
-        results.reset_index(drop=True, inplace=True)
+    def concat_files(self, frames):
+        """
+        Combine DataFrames of multiple observation data CSV files into a single one.
 
-        return results
+        Concatenating all of them at once, instead of growing the result file by file,
+        copies each row exactly once, so the runtime scales linearly with the number
+        of files.
+        """
+
+        # Concatenate all frames, and reset index column
+        results = pd.concat(frames, sort=False, ignore_index=True)
+
+        return self.convert_dates(results)
+
+    @staticmethod
+    def convert_dates(results):
+        """
+        Coerce "Eintrittsdatum" column of observation data into date format.
+        """
+        return results.assign(Eintrittsdatum=pd.to_datetime(results['Eintrittsdatum'], errors='coerce', format='%Y%m%d'))
 
     def create_megaframe(self, frame, drop_index_columns=False):
 
@@ -360,71 +728,109 @@ class DwdPhenoDataClient:
 
 
         # A. Basic filtering
+        results = self.filter_by_ids(results, criteria)
 
-        # Build "boolean indexing" filter expression from multiple ID-based criteria
-        # https://pandas.pydata.org/pandas-docs/stable/indexing.html#boolean-indexing
-        isin_map = {
-            'year': 'Referenzjahr',
-            'quality-level': 'Qualitaetsniveau',
-            'quality-byte': 'Eintrittsdatum_QB',
-            'station-id': 'Stations_id',
-            'species-id': 'Objekt_id',
-            'phase-id': 'Phase_id',
-        }
 
-        # Low-level filtering based on IDs
-        # For each designated field, add ``.isin`` criteria to "boolean index" expression
-        expression = True
-        for key, field in list(isin_map.items()):
-            if field not in results:
-                continue
-            reference = results[field]
-            if key in criteria and criteria[key]:
-                values = map(int, criteria[key])
-                expression &= reference.isin(values)
+        # B. Humanized filtering based on dimension tables
+        results = self.filter_by_patterns(results, criteria)
 
-        # Apply filter expression to DataFrame
-        if type(expression) is not bool:
-            results = results[expression]
+        return results
+
+    def filter_by_patterns(self, results, criteria):
+        """
+        Humanized filtering based on text-based criteria.
 
+        Text patterns are resolved against the small dimension tables first,
+        yielding sets of identifiers, see ``resolve_patterns``. Then, the
+        observations are filtered by those, like ``filter_by_ids`` does.
+        """
 
-        # B. Humanized filtering based on merged/joined DataFrames
+        return self.filter_by_references(results, self.resolve_patterns(criteria))
+
+    def filter_by_references(self, results, resolved):
+        """
+        Filter observations by identifiers resolved from text-based criteria, see ``resolve_patterns``.
+
+        This is cheap enough to be applied to each individual observation file,
+        when resolving the criteria only once.
+        """
 
         # Build "boolean indexing" filter expression from multiple text-based criteria
         # https://pandas.pydata.org/pandas-docs/stable/indexing.html#boolean-indexing
         # https://stackoverflow.com/questions/12065885/filter-dataframe-rows-if-value-in-column-is-in-a-set-list-of-values/26724725#26724725
-        patterns_map = {
-            'station': ['Stationsname', 'Naturraumgruppe', 'Naturraum', 'Bundesland'],
-            'species': ['Objekt', 'Objekt_englisch', 'Objekt_latein'],
-            'phase':   ['Phase', 'Phase_englisch'],
-            'quality': ['Beschreibung_x', 'Beschreibung_y'],
-        }
+        expression = True
+        for references in resolved:
+            subexpression = False
+            for id_field, ids in references:
+                subexpression |= results[id_field].isin(ids)
+            expression &= subexpression
 
-        # Remember columns of current DataFrame
-        columns = results.columns
+        # Apply filter expression to DataFrame
+        if type(expression) is not bool:
+            results = results[expression]
 
-        expression = True
-        is_megaframe = False
-        for field, reference_fields in list(patterns_map.items()):
+        return results
 
-            if field in criteria and criteria[field]:
+    def resolve_patterns(self, criteria):
+        """
+        Resolve text-based criteria to identifiers, using the dimension tables.
+
+        Returns a list with an item for each given criterion, all of them must match.
+        Each item is a list of ``(id_field, ids)`` tuples, naming the observation column
+        referencing the identifiers, and any of them counts.
+        """
 
-                # Create megaframe as this will contain all information required for advanced searching
-                if not is_megaframe:
-                    is_megaframe = True
-                    results = self.create_megaframe(results)
+        def search_table(get_table, reference_fields):
+            def resolve(patterns):
+                table = get_table()
+                pattern = '|'.join(patterns)
+                matches = False
+                for reference_field in reference_fields:
+                    matches |= table[reference_field].str.contains(pattern, case=False, na=False)
+                return table.index[matches]
+            return resolve
+
+        # Map text-based criteria to functions resolving them to identifiers,
+        # and the observation column referencing those identifiers.
+        # Stations are resolved using their text search index, other tables are small enough to scan.
+        # For "quality", a match in either quality level or quality byte counts.
+        patterns_map = {
+            'station': [(self.find_stations, 'Stations_id')],
+            'species': [(search_table(self.get_species, ['Objekt', 'Objekt_englisch', 'Objekt_latein']), 'Objekt_id')],
+            'phase':   [(search_table(self.get_phases, ['Phase', 'Phase_englisch']), 'Phase_id')],
+            'quality': [
+                (search_table(self.get_quality_levels, ['Beschreibung']), 'Qualitaetsniveau'),
+                (search_table(self.get_quality_bytes, ['Beschreibung']), 'Eintrittsdatum_QB'),
+            ],
+        }
 
+        resolved = []
+        for field, references in list(patterns_map.items()):
+            if field in criteria and criteria[field]:
                 # The list of patterns to search for. Any match counts.
-                pattern = '|'.join(criteria[field])
+                resolved.append([(id_field, resolve(criteria[field])) for resolve, id_field in references])
 
-                subexpression = False
-                for reference_field in reference_fields:
-                    subexpression |= results[reference_field].str.contains(pattern, case=False)
+        return resolved
 
-                expression &= subexpression
+    def filter_by_ids(self, results, criteria):
+        """
+        Low-level filtering based on IDs.
 
-        # Shrink megaframe back using projection on former columns
-        results = results[columns]
+        This is cheap enough to be applied to each individual observation
+        file while acquiring data, see ``query``.
+        """
+
+        # Build "boolean indexing" filter expression from multiple ID-based criteria
+        # https://pandas.pydata.org/pandas-docs/stable/indexing.html#boolean-indexing
+        # For each designated field, add ``.isin`` criteria to "boolean index" expression
+        expression = True
+        for key, field in list(self.isin_map.items()):
+            if field not in results:
+                continue
+            reference = results[field]
+            if key in criteria and criteria[key]:
+                values = list(map(int, criteria[key]))
+                expression &= reference.isin(values)
 
         # Apply filter expression to DataFrame
         if type(expression) is not bool:
@@ -478,8 +884,7 @@ class DwdPhenoDataClient:
 
     @classmethod
     def load_preset_file(cls):
-        resource = pkg_resources.resource_stream(__name__, 'presets.json')
-        return json.load(resource)
+        return load_presets()
 
     @classmethod
     def load_preset_species(cls):
@@ -532,6 +937,9 @@ class DwdPhenoDataHumanizer:
         canvas['Phase'] = phases
         canvas['Station'] = stations
 
+        # The target year can be a scalar value, or a value per row
+        if isinstance(target_year, pd.Series):
+            target_year = target_year.to_numpy()
         canvas.insert(0, 'Jahr', target_year)
 
         return canvas
@@ -568,45 +976,89 @@ class DwdPhenoDataHumanizer:
             elif language == 'latin':
                 species_field = 'Objekt_latein'
 
-        stations = []
-        species = []
-        phases = []
-        quality_levels = []
-        quality_bytes = []
-        for index, row in frame.iterrows():
+        # Build labels once per unique dimension key, and map them onto all rows
 
-            # Station
-            station_parts = [row[field] for field in station_fields if field in row]
-            station_label = ', '.join(station_parts)
+        # Station
+        def station_label(unique):
+            parts = [unique[field] for field in station_fields if field in unique]
+            label = parts[0].str.cat(parts[1:], sep=', ')
             if self.show_ids:
-                station_label += ' [{}]'.format(row['Stations_id'])
-            stations.append(station_label)
+                label += ' [' + unique['Stations_id'].astype(str) + ']'
+            return label
+        stations = self.map_labels(frame, 'Stations_id', station_fields, station_label)
 
-            # Species
-            species_label = row.get(species_field, '')
+        # Species
+        def species_label(unique):
+            label = self.column_or_empty(unique, species_field)
             if self.show_ids:
-                species_label += ' [{}]'.format(row['Objekt_id'])
-            species.append(species_label)
+                label += ' [' + unique['Objekt_id'].astype(str) + ']'
+            return label
+        species = self.map_labels(frame, 'Objekt_id', [species_field], species_label)
 
-            # Phase
-            phase_label = row.get(phase_field, '')
+        # Phase
+        def phase_label(unique):
+            label = self.column_or_empty(unique, phase_field)
             if self.show_ids:
-                phase_label += ' [{}]'.format(row['Phase_id'])
-            phases.append(phase_label)
+                label += ' [' + unique['Phase_id'].astype(str) + ']'
+            return label
+        phases = self.map_labels(frame, 'Phase_id', [phase_field], phase_label)
 
-            # Qualitaetsniveau
-            if 'Qualitaetsniveau' in row:
-                ql_label = quality_level_text.get(row['Qualitaetsniveau'], row.get('Beschreibung_x', ''))
+        # Qualitaetsniveau
+        quality_levels = []
+        if 'Qualitaetsniveau' in frame:
+            def quality_level_label(unique):
+                label = unique['Qualitaetsniveau'].map(quality_level_text)
+                label = label.fillna(self.column_or_empty(unique, 'Beschreibung_x'))
                 if self.show_ids:
-                    ql_label += ' [{}]'.format(row['Qualitaetsniveau'])
-                quality_levels.append(ql_label)
+                    label += ' [' + unique['Qualitaetsniveau'].astype(str) + ']'
+                return label
+            quality_levels = self.map_labels(frame, 'Qualitaetsniveau', ['Beschreibung_x'], quality_level_label)
 
-            # Qualitaetsbyte
-            # ftp://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/subdaily/standard_format/qualitaetsbytes.pdf
-            if 'Eintrittsdatum_QB' in row:
-                qb_label = row.get('Beschreibung_y', '')
+        # Qualitaetsbyte
+        # ftp://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/subdaily/standard_format/qualitaetsbytes.pdf
+        quality_bytes = []
+        if 'Eintrittsdatum_QB' in frame:
+            def quality_byte_label(unique):
+                label = self.column_or_empty(unique, 'Beschreibung_y')
                 if self.show_ids:
-                    qb_label += ' [{}]'.format(row['Eintrittsdatum_QB'])
-                quality_bytes.append(qb_label)
+                    label += ' [' + unique['Eintrittsdatum_QB'].astype(str) + ']'
+                return label
+            quality_bytes = self.map_labels(frame, 'Eintrittsdatum_QB', ['Beschreibung_y'], quality_byte_label)
 
         return stations, species, phases, quality_levels, quality_bytes
+
+    @staticmethod
+    def map_labels(frame, key_field, label_fields, compute):
+        """
+        Compute labels using ``compute`` only once per unique key, and map them onto all rows of ``frame``.
+
+        The key is the ``key_field`` identifier column. When it is not present, the
+        combination of all ``label_fields`` is used instead. Returns a numpy array.
+        """
+        if key_field in frame:
+            keys = [key_field]
+        else:
+            keys = [field for field in label_fields if field in frame]
+        columns = keys + [field for field in label_fields if field in frame and field not in keys]
+        unique = frame[columns].drop_duplicates(subset=keys)
+        unique = unique.assign(label=compute(unique))
+        labels = frame[keys].merge(unique[keys + ['label']], on=keys, how='left')['label']
+        return labels.to_numpy()
+
+    @staticmethod
+    def column_or_empty(frame, field):
+        if field in frame:
+            return frame[field]
+        return pd.Series('', index=frame.index)
+
+
+@functools.lru_cache(maxsize=None)
+def load_presets():
+    """
+    Read ``presets.json`` once per process. The result is shared, so do not modify it.
+    """
+    if hasattr(importlib.resources, "files"):
+        text = importlib.resources.files(__package__).joinpath("presets.json").read_text(encoding="utf-8")
+    else:
+        text = importlib.resources.read_text(__package__, "presets.json", encoding="utf-8")
+    return json.loads(text)
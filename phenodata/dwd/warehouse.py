@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# (c) 2023, The Earth Observations Developers
+import dataclasses
+import glob
+import json
+import logging
+import os
+import typing as t
+
+import pandas as pd
+
+from phenodata.dwd.cdc import DwdCdcClient
+from phenodata.dwd.model import CanonicalColumnMap, DwdPhenoDataset, DwdPhenoPartition
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from phenodata.util import iterate_with_progressbar, regex_make_matchers, regex_run_matchers
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class DwdPhenoWarehouse:
+    """
+    Local columnar store of DWD phenology observations, consolidating all datasets
+    and partitions into a single partitioned Parquet dataset, with one file per
+    source file on the CDC FTP server::
+
+        <path>/dataset=immediate/partition=recent/PH_Sofortmelder_Wildwachsende_Pflanze_Hasel_akt.parquet
+
+    Columns use canonical names, see ``CanonicalColumnMap.observation``. Each row records
+    its provenance within the ``source``, ``dataset``, ``partition``, and ``file`` columns.
+
+    The manifest file records the modification time of each source file, so ``sync``
+    will only re-acquire files which changed, and replace exactly their rows.
+
+    Reading and writing Parquet files needs the ``pyarrow`` package.
+    """
+
+    # Path to store directory
+    path: str
+
+    # Name of the manifest file within the store directory
+    manifest_name = "manifest.json"
+
+    # Number of acquired files after which the manifest is saved, see ``sync_partition``
+    manifest_interval = 100
+
+    # Columns recording the provenance of each row
+    provenance_columns = ["source", "dataset", "partition", "file"]
+
+    def sync(self, cdc: DwdCdcClient, datasets: t.Optional[t.List[str]] = None, partitions: t.Optional[t.List[str]] = None):
+        """
+        Synchronize store with all observation files on the CDC FTP server.
+        """
+        manifest = self.load_manifest()
+        for dataset in datasets or [item.value for item in DwdPhenoDataset]:
+            client = DwdPhenoDataClient(cdc=cdc, dataset=dataset)
+            for partition in partitions or [item.value for item in DwdPhenoPartition]:
+                self.sync_partition(client, partition, manifest)
+
+    def sync_partition(self, client: DwdPhenoDataClient, partition: str, manifest: t.Dict[str, t.Dict]):
+        """
+        Synchronize store with observation files of one dataset and partition.
+
+        - Remove files which vanished from the server
+        - Acquire files which are new, or whose modification time changed
+
+        The manifest is saved every ``manifest_interval`` files, and when finishing
+        or aborting, so an interrupted run can be resumed.
+        """
+        dataset = client.dataset
+        entries = {entry["url"]: entry for entry in client.scan_files(partition)}
+
+        try:
+            # Remove files which vanished from the server
+            for url, item in list(manifest.items()):
+                if item["dataset"] == dataset and item["partition"] == partition and url not in entries:
+                    logger.info(f'Removing rows of vanished file "{url}"')
+                    self.remove(item["path"])
+                    del manifest[url]
+
+            changed = [url for url, entry in entries.items() if manifest.get(url, {}).get("mtime") != str(entry["mtime"])]
+            logger.info(f"Synchronizing {len(changed)} of {len(entries)} files of dataset={dataset}, partition={partition}")
+
+            items = client.cdc.get_dataframes(changed, coerce_int=True)
+            for position, (url, data) in enumerate(iterate_with_progressbar(items, total=len(changed)), start=1):
+                name = entries[url]["name"]
+                path = self.file_path(dataset, partition, name)
+
+                if data is None or data.empty:
+                    logger.warning(f'File "{url}" is empty')
+                    self.remove(path)
+                    rows = 0
+                else:
+                    frame = self.to_canonical(client.convert_dates(data), dataset=dataset, partition=partition, file=name)
+                    self.write(path, frame)
+                    rows = len(frame)
+
+                manifest[url] = {
+                    "dataset": dataset,
+                    "partition": partition,
+                    "mtime": str(entries[url]["mtime"]),
+                    "path": path,
+                    "rows": rows,
+                }
+                if position % self.manifest_interval == 0:
+                    self.save_manifest(manifest)
+        finally:
+            self.save_manifest(manifest)
+
+    def read_frames(self, dataset: str, partition: str, include: t.Optional[t.List[str]] = None):
+        """
+        Read observations of one dataset and partition, and yield a DataFrame for each source file.
+
+        DataFrames use the original DWD column names, like ``DwdPhenoDataClient.read_files``.
+        Optionally obtains ``include`` parameter, which will be applied as a filter to file names.
+        """
+        directory = os.path.join(self.path, self.file_path(dataset, partition, ""))
+        if not os.path.isdir(directory):
+            logger.warning(f'Store does not contain dataset={dataset}, partition={partition}. Use "phenodata sync".')
+            return
+
+        matchers = regex_make_matchers(include or [])
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".parquet"):
+                continue
+            if matchers and not regex_run_matchers(matchers, name):
+                continue
+            yield self.from_canonical(pd.read_parquet(os.path.join(directory, name)))
+
+    def query(self, client: DwdPhenoDataClient, sql: str, partition: str, criteria: t.Optional[t.Dict] = None) -> pd.DataFrame:
+        """
+        Run SQL query using DuckDB, directly against the Parquet files of the store.
+
+        Filters, joins, and aggregations will be executed by DuckDB, without materializing
+        all observations as pandas DataFrame first. The query can use those views:
+
+        - ``observation``: All observations in the store, using canonical column names,
+          including the provenance columns. It is empty when the store has not been
+          synchronized yet.
+        - ``station``, ``species``, ``phase``, ``quality_level``, ``quality_byte``:
+          The dimension tables, using canonical column names.
+        - ``data``: Observations of the client's dataset and designated partition, filtered
+          by ``criteria``, using the original DWD column names. This is the same data
+          ``--sql`` queries of ``phenodata observations`` use without ``--store``.
+
+        Needs the ``duckdb`` package.
+        """
+        import duckdb
+
+        connection = duckdb.connect()
+
+        pattern = os.path.join(self.path, "*", "*", "*.parquet")
+        if glob.glob(pattern):
+            connection.execute(f"CREATE VIEW observation AS SELECT * FROM read_parquet({sql_literal(pattern)}, hive_partitioning=false)")
+        else:
+            logger.warning(f'Store at {self.path} does not contain any observations. Use "phenodata sync".')
+            connection.execute(f"CREATE VIEW observation AS {self.empty_sql()}")
+
+        # Dimension tables are small, so register their DataFrames
+        dimensions = {
+            "station": client.get_stations(all=True),
+            "species": client.get_species(),
+            "phase": client.get_phases(),
+            "quality_level": client.get_quality_levels(),
+            "quality_byte": client.get_quality_bytes(),
+        }
+        for name, frame in dimensions.items():
+            collection = getattr(CanonicalColumnMap, name)
+            frame = frame.rename(columns=collection.column_map)
+            frame.index.names = collection.index_names
+            connection.register(name, frame.reset_index())
+
+        connection.execute(f"CREATE VIEW data AS {self.data_sql(client, partition, criteria or {})}")
+
+        return connection.execute(sql).df()
+
+    @classmethod
+    def empty_sql(cls) -> str:
+        """
+        Compute SQL statement selecting no observations, using the column names and types of the store.
+        """
+        columns = [f'CAST(NULL AS {"TIMESTAMP" if canonical == "date" else "BIGINT"}) AS "{canonical}"'
+                   for canonical in CanonicalColumnMap.observation.column_map.values()]
+        columns += [f'CAST(NULL AS VARCHAR) AS "{column}"' for column in cls.provenance_columns]
+        return f"SELECT {', '.join(columns)} WHERE false"
+
+    @staticmethod
+    def data_sql(client: DwdPhenoDataClient, partition: str, criteria: t.Dict) -> str:
+        """
+        Compute SQL statement selecting observations like ``DwdPhenoDataClient.get_observations``.
+        """
+        column_map = CanonicalColumnMap.observation.column_map
+        columns = ", ".join(f'{canonical} AS "{original}"' for original, canonical in column_map.items())
+
+        conditions = [f'"dataset" = {sql_literal(client.dataset)}', f'"partition" = {sql_literal(partition)}']
+        if criteria.get("filename"):
+            patterns = " OR ".join(f'regexp_matches("file", {sql_literal(pattern)})' for pattern in criteria["filename"])
+            conditions.append(f"({patterns})")
+
+        # ID-based criteria, see ``DwdPhenoDataClient.filter_by_ids``
+        for key, field in client.isin_map.items():
+            if criteria.get(key):
+                conditions.append(sql_isin(column_map[field], criteria[key]))
+
+        # Text-based criteria resolved to identifiers, see ``DwdPhenoDataClient.filter_by_patterns``
+        for references in client.resolve_patterns(criteria):
+            alternatives = " OR ".join(sql_isin(column_map[id_field], ids) for id_field, ids in references)
+            conditions.append(f"({alternatives})")
+
+        return f"SELECT {columns} FROM observation WHERE {' AND '.join(conditions)}"
+
+    @staticmethod
+    def file_path(dataset: str, partition: str, name: str) -> str:
+        """
+        Compute path of Parquet file for source file ``name``, relative to the store directory.
+        """
+        if name:
+            name = os.path.splitext(name)[0] + ".parquet"
+        return os.path.join(f"dataset={dataset}", f"partition={partition}", name)
+
+    @classmethod
+    def to_canonical(cls, frame: pd.DataFrame, dataset: str, partition: str, file: str) -> pd.DataFrame:
+        frame = frame.rename(columns=CanonicalColumnMap.observation.column_map)
+        frame["source"] = "dwd"
+        frame["dataset"] = dataset
+        frame["partition"] = partition
+        frame["file"] = file
+        return frame
+
+    @classmethod
+    def from_canonical(cls, frame: pd.DataFrame) -> pd.DataFrame:
+        column_map = {value: key for key, value in CanonicalColumnMap.observation.column_map.items()}
+        return frame.drop(columns=cls.provenance_columns, errors="ignore").rename(columns=column_map)
+
+    def write(self, path: str, frame: pd.DataFrame):
+        filename = os.path.join(self.path, path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Write to temporary file first, so readers will never see partial files
+        tempfile = f"{filename}.tmp"
+        frame.to_parquet(tempfile, index=False)
+        os.replace(tempfile, filename)
+
+    def remove(self, path: str):
+        try:
+            os.remove(os.path.join(self.path, path))
+        except FileNotFoundError:
+            pass
+
+    def load_manifest(self) -> t.Dict[str, t.Dict]:
+        try:
+            with open(os.path.join(self.path, self.manifest_name), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_manifest(self, manifest: t.Dict[str, t.Dict]):
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, self.manifest_name)
+        tempfile = f"{filename}.tmp"
+        with open(tempfile, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tempfile, filename)
+
+
+def sql_literal(value: str) -> str:
+    """
+    Quote string as SQL literal.
+    """
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def sql_isin(column: str, values) -> str:
+    """
+    Compute SQL condition matching integer ``values`` of ``column``.
+    """
+    values = sorted(set(map(int, values)))
+    if not values:
+        return "false"
+    return f"{column} IN ({', '.join(map(str, values))})"
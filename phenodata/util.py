@@ -2,15 +2,17 @@
 # (c) 2018-2023, The Earth Observations Developers
 from __future__ import division
 
+import bisect
+import contextlib
 import numbers
 import re
 import sys
 import math
 import logging
-import numpy as np
-import pandas as pd
-from tqdm import tqdm
-from tqdm.contrib.logging import logging_redirect_tqdm
+import unicodedata
+
+# numpy, pandas, and tqdm are imported within the functions using them,
+# so command line invocations not processing any data start quickly.
 
 
 def boot_logging(options=None):
@@ -88,6 +90,7 @@ def dataframe_strip_strings(col):
     if sys.version_info.major == 2:
         comptype = unicode  # FIXME
 
+    import numpy as np
     if str(col.dtype) in ["object", "str"]:
         return (col.astype(comptype)
                 .str.strip(' \t')
@@ -113,9 +116,266 @@ def haversine_distance(destination, origin):
     d = radius * c
     return d
 
-def iterate_with_progressbar(items):
-    with logging_redirect_tqdm():
-        for path in tqdm(items, ncols=80):
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Vectorized variant of ``haversine_distance``, computing distances in meters
+    between arrays of positions, with numpy broadcasting rules.
+    """
+    import numpy as np
+
+    radius = 6371000 # meters
+
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    a = np.sin(dlat / 2) * np.sin(dlat / 2) + np.cos(np.radians(lat1)) \
+        * np.cos(np.radians(lat2)) * np.sin(dlon / 2) * np.sin(dlon / 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return radius * c
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Convert geographic positions into 3D unit vectors.
+    """
+    import numpy as np
+
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class SpatialIndex:
+    """
+    Nearest neighbour search for geographic positions on the sphere.
+
+    Positions are stored as 3D unit vectors, where the nearest position has the
+    largest dot product. Queries are processed in blocks, each using a single
+    matrix multiplication. For a few thousand positions, like the list of
+    phenology stations, this is faster than traversing a tree structure.
+
+    The index is not persisted. Building it for the list of phenology stations
+    takes a fraction of a millisecond, less than loading it would take.
+    """
+
+    # Number of query positions processed at once, to bound memory usage
+    block_size = 2048
+
+    def __init__(self, latitudes, longitudes):
+        import numpy as np
+
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.vectors = unit_vectors(self.latitudes, self.longitudes)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def query(self, latitudes, longitudes, k=10):
+        """
+        Find the ``k`` nearest positions for each query position.
+
+        Returns two arrays of shape ``(len(latitudes), k)``, with the positions
+        of the nearest items within the index, and their distances in meters,
+        sorted ascending by distance. Raises ``ValueError`` when ``k`` is less
+        than one, or when query positions are not finite numbers.
+        """
+        import numpy as np
+
+        if k < 1:
+            raise ValueError(f'Number of nearest positions must be at least 1, got {k}')
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if not (np.isfinite(latitudes).all() and np.isfinite(longitudes).all()):
+            raise ValueError('Latitude and longitude of query positions must be finite numbers')
+        k = min(k, len(self))
+        positions = np.empty((len(latitudes), k), dtype=int)
+        distances = np.empty((len(latitudes), k), dtype=float)
+        for start in range(0, len(latitudes), self.block_size):
+            block = slice(start, start + self.block_size)
+            similarity = unit_vectors(latitudes[block], longitudes[block]) @ self.vectors.T
+
+            # Select the k most similar candidates, then sort them by actual distance
+            candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k] if k < len(self) else \
+                np.broadcast_to(np.arange(len(self)), similarity.shape)
+            candidate_distances = haversine_distances(
+                self.latitudes[candidates], self.longitudes[candidates],
+                latitudes[block, None], longitudes[block, None])
+            order = np.argsort(candidate_distances, axis=1, kind='stable')
+            positions[block] = np.take_along_axis(candidates, order, axis=1)
+            distances[block] = np.take_along_axis(candidate_distances, order, axis=1)
+        return positions, distances
+
+# Transliterations applied before matching, so "Muenchen" will find "München"
+transliterations = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+# Characters which designate a pattern to be a regular expression
+regex_characters = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+def normalize_text(text):
+    """
+    Normalize text for matching: Casefold, transliterate umlauts, and strip other diacritics.
+    """
+    text = str(text).casefold().translate(transliterations)
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def edit_distance(a, b, limit):
+    """
+    Compute the Levenshtein distance between two strings, giving up
+    with ``limit + 1`` as soon as it will exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class TextSearchIndex:
+    """
+    Text search over the rows of a table, like the list of phenology stations.
+
+    Texts are normalized using ``normalize_text``, and split into tokens. Then,
+    postings map trigrams to rows, and tokens to rows, so queries will mostly be
+    resolved by set lookups instead of scanning all texts. Supported modes are:
+
+    - "substring": Find rows containing the query in one of their fields,
+      like ``str.contains``. Patterns containing regular expression characters
+      are matched against the original texts, for compatibility.
+    - "prefix": Find rows with a token starting with each query token.
+    - "fuzzy": Find rows with a token similar to each query token, within
+      an edit distance of 1 or 2, depending on the token length.
+
+    Search results are arrays of row positions, in ascending order.
+    """
+
+    def __init__(self, frame, fields):
+        # Keep the fields of each row, so regular expressions will be matched against each field
+        self.originals = frame[fields].fillna('').astype(str).values.tolist()
+
+        # Separate the fields by newlines, so substring queries will not match across them
+        self.texts = [normalize_text('\n'.join(texts)) for texts in self.originals]
+
+        self.trigram_rows = {}
+        self.token_rows = {}
+        for row, text in enumerate(self.texts):
+            for trigram in trigrams(text):
+                self.trigram_rows.setdefault(trigram, set()).add(row)
+            for token in re.findall(r'\w+', text):
+                self.token_rows.setdefault(token, set()).add(row)
+
+        # Sorted vocabulary for prefix lookups, and trigrams of padded tokens for fuzzy lookups
+        self.tokens = sorted(self.token_rows)
+        self.token_trigrams = {}
+        for token in self.tokens:
+            for trigram in trigrams(f'  {token} '):
+                self.token_trigrams.setdefault(trigram, set()).add(token)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query, mode='substring'):
+        if mode == 'substring':
+            rows = self.search_substring(query)
+        elif mode == 'prefix':
+            rows = self.search_tokens(query, self.prefix_tokens)
+        elif mode == 'fuzzy':
+            rows = self.search_tokens(query, self.similar_tokens)
+        else:
+            raise ValueError(f'Unknown search mode "{mode}"')
+
+        import numpy as np
+
+        return np.array(sorted(rows), dtype=int)
+
+    def search_substring(self, query):
+        if regex_characters.search(query):
+            matcher = re.compile(query, re.IGNORECASE)
+            return {row for row, texts in enumerate(self.originals) if any(matcher.search(text) for text in texts)}
+
+        query = normalize_text(query)
+        candidates = None
+        for trigram in trigrams(query):
+            rows = self.trigram_rows.get(trigram, set())
+            candidates = rows if candidates is None else candidates & rows
+            if not candidates:
+                return set()
+
+        # Queries shorter than three characters have no trigrams, so check all rows
+        if candidates is None:
+            candidates = range(len(self))
+        return {row for row in candidates if query in self.texts[row]}
+
+    def search_tokens(self, query, expand):
+        """
+        Find rows matching all query tokens, each expanded to a set of tokens from the vocabulary.
+        """
+        result = None
+        for token in re.findall(r'\w+', normalize_text(query)):
+            rows = set()
+            for candidate in expand(token):
+                rows |= self.token_rows[candidate]
+            result = rows if result is None else result & rows
+            if not result:
+                return set()
+        return result or set()
+
+    def prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self.tokens, prefix)
+        for token in self.tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def similar_tokens(self, token):
+        limit = 0 if len(token) <= 2 else 1 if len(token) <= 5 else 2
+
+        # Each edit changes at most three trigrams, so similar tokens share the others
+        query_trigrams = trigrams(f'  {token} ')
+        counts = {}
+        for trigram in query_trigrams:
+            for candidate in self.token_trigrams.get(trigram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        threshold = len(query_trigrams) - 3 * limit
+        candidates = self.tokens if threshold <= 0 else [candidate for candidate, count in counts.items() if count >= threshold]
+
+        for candidate in candidates:
+            if edit_distance(token, candidate, limit) <= limit:
+                yield candidate
+
+def day_of_year_to_date(year, days):
+    """
+    Convert Series of "day of the year" values into dates within designated year.
+
+    Like ``pd.to_datetime(year * 1000 + days, format='%Y%j', errors='coerce')``,
+    values outside the range of 1 to 366 will be ``NaT``.
+    """
+    import pandas as pd
+
+    dates = pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(days - 1, unit='D')
+    return dates.where((days >= 1) & (days <= 366))
+
+def iterate_with_progressbar(items, total=None, desc=None, position=None):
+    """
+    Iterate over ``items``, displaying a progress bar, while redirecting log messages.
+
+    When displaying multiple progress bars concurrently, give each one its own line
+    using ``position``. Then, the caller is responsible for redirecting log messages
+    using ``logging_redirect_tqdm`` once, because it swaps the handlers of the root
+    logger, which must not happen from multiple threads at the same time.
+    """
+    from tqdm import tqdm
+    from tqdm.contrib.logging import logging_redirect_tqdm
+
+    with logging_redirect_tqdm() if position is None else contextlib.nullcontext():
+        for path in tqdm(items, total=total, desc=desc, ncols=80, position=position):
             yield path
 
 # From `past.utils.old_div()` / `future.utils.old_div()`.
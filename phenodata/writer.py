@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# (c) 2018-2023, The Earth Observations Developers
+import functools
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class DataFrameStreamWriter:
+    """
+    Write a sequence of DataFrames to a text stream, batch by batch.
+
+    The output is the same as when concatenating all DataFrames and
+    serializing them at once, but without holding all of them in memory.
+    The "ndjson" format writes one JSON object per line.
+    """
+
+    formats = ['csv', 'json', 'ndjson']
+
+    # Number of rows serialized at once, to bound memory usage
+    batch_size = 10_000
+
+    def __init__(self, stream, format='csv', index=False):
+        if format not in self.formats:
+            raise ValueError(f'Unknown output format "{format}"')
+        self.stream = stream
+        self.format = format
+        self.index = index
+        self.count = 0
+
+    def write(self, frame):
+        """
+        Write DataFrame, serializing it in batches of ``batch_size`` rows.
+        """
+        if frame.empty:
+            self.write_batch(frame)
+        for start in range(0, len(frame), self.batch_size):
+            self.write_batch(frame.iloc[start:start + self.batch_size])
+            self.stream.flush()
+
+    def write_batch(self, frame):
+        if self.format == 'csv':
+            self.stream.write(frame.to_csv(encoding='utf-8', index=self.index, header=self.count == 0))
+
+        elif self.format in ['json', 'ndjson']:
+            if self.index:
+                frame = frame.reset_index()
+            if frame.empty:
+                return
+            if self.format == 'json':
+                # Write records without the enclosing brackets of the JSON array
+                records = frame.to_json(orient='records', date_format='iso')[1:-1]
+                self.stream.write(('[' if self.count == 0 else ',') + records)
+            else:
+                self.stream.write(frame.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n')
+
+        self.count += 1
+
+    def close(self):
+        if self.format == 'json':
+            self.stream.write('[]' if self.count == 0 else ']')
+            self.stream.write('\n')
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TableRenderer:
+    """
+    Render a DataFrame as text table, looking like the output of ``tabulate``.
+
+    Instead of converting and measuring each cell individually, values are converted
+    to strings column by column, and column widths are computed using vectorized
+    string operations. Rows are written to the stream in pages of ``page_size`` rows.
+
+    Like ``tabulate``, columns are typed by their values, so numeric strings count as
+    numbers. Numeric columns are aligned right, floats at their decimal point, all
+    others left. Supports the "psql" and "pipe" (Markdown) table formats.
+    """
+
+    formats = ['psql', 'pipe']
+
+    # Number of rows written at once
+    page_size = 10_000
+
+    # Minimum padding of header within column, like ``tabulate.MIN_PADDING``
+    min_padding = 2
+
+    def __init__(self, stream, format='psql', index=False):
+        if format not in self.formats:
+            raise ValueError(f'Unknown table format "{format}"')
+        self.stream = stream
+        self.format = format
+        self.index = index
+
+    def render(self, frame):
+        # ``tabulate`` reads the values matrix of the frame. When all columns are numeric,
+        # it contains numpy scalars, which ``tabulate`` types as floats.
+        kinds = {dtype.kind if isinstance(dtype, np.dtype) else None for dtype in frame.dtypes}
+        floats = kinds <= {'i', 'u', 'f'} or kinds == {'b'}
+
+        columns = [(str(name), *self.stringify(frame.iloc[:, position], floats=floats))
+                   for position, name in enumerate(frame.columns)]
+        if self.index:
+            columns.insert(0, ('', *self.stringify(pd.Series(frame.index, index=frame.index))))
+
+        widths = [max(len(header) + self.min_padding, int(values.str.len().max()) if len(values) else 0)
+                  for header, values, numeric in columns]
+
+        def pad(value, width, numeric):
+            return value.rjust(width) if numeric else value.ljust(width)
+
+        header = '| ' + ' | '.join(pad(header, width, numeric) for (header, _, numeric), width in zip(columns, widths)) + ' |'
+        if self.format == 'psql':
+            border = '+' + '+'.join('-' * (width + 2) for width in widths) + '+'
+            separator = '|' + '+'.join('-' * (width + 2) for width in widths) + '|'
+            self.stream.write(border + '\n' + header + '\n' + separator + '\n')
+        elif self.format == 'pipe':
+            separator = '|' + '|'.join(
+                '-' * (width + 1) + ':' if numeric else ':' + '-' * (width + 1)
+                for (_, _, numeric), width in zip(columns, widths)) + '|'
+            self.stream.write(header + '\n' + separator + '\n')
+
+        for start in range(0, len(frame), self.page_size):
+            page = slice(start, start + self.page_size)
+            lines = None
+            for (_, values, numeric), width in zip(columns, widths):
+                cells = values.iloc[page]
+                cells = cells.str.rjust(width) if numeric else cells.str.ljust(width)
+                lines = '| ' + cells if lines is None else lines + ' | ' + cells
+            self.stream.write('\n'.join(lines + ' |') + '\n')
+            self.stream.flush()
+
+        if self.format == 'psql':
+            self.stream.write(border + '\n')
+
+    @classmethod
+    def stringify(cls, values, floats=False):
+        """
+        Convert Series to strings, and tell whether it is numeric.
+
+        Numeric strings are padded, so they align at their decimal point when aligned right.
+        With ``floats``, numeric values are typed as floats, see ``render``.
+        """
+        dtype = values.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in 'iuf' + ('b' if floats else ''):
+            value_type = float if floats or dtype.kind == 'f' else int
+        elif isinstance(dtype, np.dtype) and dtype.kind == 'b':
+            value_type = bool
+        else:
+            value_type = None
+        if value_type is float:
+            strings = values.astype(float).map('{:g}'.format)
+        elif value_type is not None:
+            strings = values.astype(str)
+        else:
+            # Type values individually, like ``tabulate``
+            values = values.astype(object)
+            try:
+                unique = list(dict.fromkeys(values))
+            except TypeError:
+                unique = list(values)
+            value_type = functools.reduce(more_generic_type, map(table_value_type, unique), bool)
+            strings = values.map(functools.partial(format_table_value, value_type=value_type))
+        strings = strings.astype(object).reset_index(drop=True)
+
+        numeric = value_type in (int, float)
+        if not numeric:
+            return strings.str.strip(), numeric
+
+        # Pad numbers at their end, so that their decimal points align
+        point = strings.str.rfind('.')
+        point = point.where(point >= 0, strings.str.rfind('e'))
+        decimals = (strings.str.len() - point - 1).where((point >= 0) & (value_type is float), -1)
+        if len(strings):
+            strings = strings + (decimals.max() - decimals).map(' '.__mul__)
+        return strings, numeric
+
+
+# Types of table values, from the least to the most generic, like ``tabulate``
+table_value_types = [type(None), bool, int, float, str]
+
+
+def table_value_type(value):
+    """
+    The type of a table value, like ``tabulate`` infers it. Numeric strings are numbers.
+    """
+    if value is None:
+        return type(None)
+    if hasattr(value, 'isoformat'):
+        return str
+    if type(value) is bool or isinstance(value, str) and value in ('True', 'False'):
+        return bool
+    if type(value) is int or isinstance(value, str) and is_convertible(int, value):
+        return int
+    if is_convertible(float, value):
+        if isinstance(value, str) and (math.isinf(float(value)) or math.isnan(float(value))):
+            return float if value.lower() in ['inf', '-inf', 'nan'] else str
+        return float
+    return str
+
+
+def more_generic_type(left, right):
+    position = max(table_value_types.index(left), table_value_types.index(right))
+    return table_value_types[position]
+
+
+def format_table_value(value, value_type):
+    if value is None:
+        return ''
+    if value_type is int:
+        return format(value, '')
+    if value_type is float:
+        return format(float(value), 'g')
+    return f'{value}'
+
+
+def is_convertible(conversion, value):
+    try:
+        conversion(value)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+# Binary output formats preserving dtypes, see ``write_columnar``
+columnar_formats = ['parquet', 'arrow']
+
+
+def write_columnar(frame, stream, format='parquet', index=False):
+    """
+    Write DataFrame to a binary stream, in Apache Parquet or Arrow IPC stream format.
+
+    Both formats preserve dtypes, including dates and categoricals. Because
+    Parquet files have their metadata at the end, and standard output is not
+    seekable, Parquet output is assembled in memory first. Arrow output is
+    written to the stream in batches of ``DataFrameStreamWriter.batch_size`` rows.
+
+    Needs the ``pyarrow`` package.
+    """
+    import pyarrow as pa
+
+    if format not in columnar_formats:
+        raise ValueError(f'Unknown output format "{format}"')
+
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        sink = pa.BufferOutputStream()
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=index), sink)
+        stream.write(sink.getvalue())
+
+    elif format == 'arrow':
+        batch_size = DataFrameStreamWriter.batch_size
+        schema = pa.Schema.from_pandas(frame, preserve_index=index)
+        with pa.ipc.new_stream(pa.PythonFile(stream, mode='w'), schema) as writer:
+            for start in range(0, len(frame), batch_size):
+                batch = frame.iloc[start:start + batch_size]
+                writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=index))
+
+    stream.flush()
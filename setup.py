@@ -15,7 +15,6 @@ requires = [
     'platformdirs<4',
     'requests>=2.18.4,<3',
     'requests-ftp>=0.3.1,<4',
-    'setuptools<81',
     'sqlalchemy>2,<2.1',
     'tabulate>=0.8.2,<0.10',
     'tqdm>=4.60,<5',
@@ -90,6 +89,7 @@ setup(name='phenodata',
     zip_safe=False,
     install_requires=requires,
     extras_require={
+        'pyarrow': ['pyarrow>=7,<27'],
         'sql': ['duckdb>=0.3,<1.5'],
         'test': test_requires,
     },
@@ -1,4 +1,6 @@
 import re
+import subprocess
+import sys
 
 import pytest
 
@@ -24,3 +26,23 @@ def test_cli_version(capsys):
 
     out, err = capsys.readouterr()
     assert re.match(r"phenodata \d+\.\d+\.\d+.*", out)
+
+
+@pytest.mark.parametrize("command", ["info", "--version"])
+def test_cli_startup_imports(command):
+    """
+    CLI test: Verify short commands do not import heavy dependencies, so they start quickly.
+    """
+    heavy = ["arrow", "dogpile", "numpy", "pandas", "pkg_resources", "requests_ftp", "setuptools", "sqlalchemy", "tabulate", "tqdm"]
+    program = f"""
+import sys
+from phenodata.command import run
+sys.argv = ["phenodata", "{command}"]
+try:
+    run()
+except SystemExit:
+    pass
+print("imported:", sorted(name for name in {heavy!r} if name in sys.modules))
+"""
+    result = subprocess.run([sys.executable, "-c", program], capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines()[-1] == "imported: []"
@@ -1,10 +1,12 @@
 import sqlite3
 import sys
 
+import pandas as pd
 import pytest
 from datadiff.tools import assert_equal
 
-from tests.util import run_command
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from tests.util import StaticCdcClient, StaticFTPSession, run_command
 
 if sys.version_info < (3, 8):
     raise pytest.skip(msg="The SQLite export feature does not work on Python 3.7", allow_module_level=True)
@@ -82,3 +84,343 @@ def test_export_sqlite_species_group(tmp_path):
         (2025, 32, 'dwd', 'Hasel', 'Blüte Beginn', 'Müncheberg (Ph)'),
         (2025, 74, 'dwd', 'Sal-Weide', 'Blüte Beginn', 'Müncheberg (Ph)'),
     ])
+
+
+def test_export_sqlite_bulk(tmp_path):
+    """
+    Verify the SQLite bulk loader yields the same data as the generic path, and both create primary keys.
+    """
+    import sqlite3
+
+    from phenodata.dwd.export import acquire_database
+
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(3, rows=10), dataset="immediate")
+    options = {"dataset": "immediate", "partition": "recent", "filter": None, "all": False}
+    db = acquire_database(client, options=options).with_canonical_column_names()
+    db.chunksize = 4
+
+    db.to_sql(f"sqlite:///{tmp_path / 'bulk.sqlite'}")
+    db.to_sql(f"sqlite:///{tmp_path / 'generic.sqlite'}", bulk=False)
+
+    def dump(filename):
+        connection = sqlite3.connect(tmp_path / filename)
+        rows = connection.execute("SELECT * FROM dwd_phenology ORDER BY observation_id, station_id").fetchall()
+        stations = connection.execute("SELECT * FROM dwd_station ORDER BY id").fetchall()
+        return rows, stations
+
+    rows, stations = dump("bulk.sqlite")
+    assert len(rows) == 3 * 10
+    assert rows[0][7] == "2023-02-25 00:00:00.000000"
+    assert (rows, stations) == dump("generic.sqlite")
+
+    for filename in ["bulk.sqlite", "generic.sqlite"]:
+        connection = sqlite3.connect(tmp_path / filename)
+        assert [row[5] for row in connection.execute("PRAGMA table_info(dwd_station)")][0] == 1
+        indexes = [row[1] for row in connection.execute("PRAGMA index_list(dwd_observation)")]
+        assert "ix_dwd_observation_station_id" in indexes
+        assert "ix_dwd_observation_date" in indexes
+
+
+def test_export_sqlite_materialize(tmp_path):
+    """
+    Verify materializing the ``dwd_phenology`` views as indexed tables.
+    """
+    import sqlite3
+
+    from phenodata.dwd.export import acquire_database
+
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(2, rows=10), dataset="immediate")
+    options = {"dataset": "immediate", "partition": "recent", "filter": None, "all": False}
+    db = acquire_database(client, options=options).with_canonical_column_names()
+    db.to_sql(f"sqlite:///{tmp_path / 'materialized.sqlite'}", materialize=True)
+
+    connection = sqlite3.connect(tmp_path / "materialized.sqlite")
+    kinds = dict(connection.execute("SELECT name, type FROM sqlite_master WHERE name LIKE 'dwd_phenology%'"))
+    assert kinds == {"dwd_phenology": "table", "dwd_phenology_group": "table"}
+
+    plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM dwd_phenology WHERE station_id = 3").fetchall()
+    assert "ix_dwd_phenology_station_id" in plan[0][-1]
+    assert connection.execute("SELECT COUNT(*) FROM dwd_phenology WHERE station_id = 3").fetchone() == (2,)
+
+    # Exporting again replaces the materialized tables
+    db.to_sql(f"sqlite:///{tmp_path / 'materialized.sqlite'}")
+    kinds = dict(connection.execute("SELECT name, type FROM sqlite_master WHERE name LIKE 'dwd_phenology%'"))
+    assert kinds == {"dwd_phenology": "view", "dwd_phenology_group": "view"}
+
+
+def test_export_sqlite_incremental(tmp_path):
+    """
+    Verify incremental exports only replace observations of changed source files.
+    """
+    import sqlite3
+
+    from phenodata.dwd.export import export_database
+
+    cdc = StaticCdcClient(3, rows=10)
+    client = DwdPhenoDataClient(cdc=cdc, dataset="annual")
+    target = f"sqlite:///{tmp_path / 'incremental.sqlite'}"
+    options = {"dataset": "annual", "partition": "recent", "filter": None, "all": False, "incremental": True}
+
+    def count():
+        connection = sqlite3.connect(tmp_path / "incremental.sqlite")
+        return connection.execute("SELECT file, day_of_year, COUNT(*) FROM dwd_observation GROUP BY file, day_of_year ORDER BY file").fetchall()
+
+    export_database(client, target, options)
+    assert cdc.reads == 3
+    assert count() == [(f"PH_Sofortmelder_{i}_akt.txt", 56, 10) for i in range(3)]
+
+    # Nothing changed
+    export_database(client, target, options)
+    assert cdc.reads == 3
+
+    # Only the changed file will be acquired, and its rows will be replaced
+    cdc.ftp.mtimes["ftp://localhost/observations_germany/phenology/annual_reporters/recent/PH_Sofortmelder_1_akt.txt"] = "2023-03-02T00:00:00"
+    cdc.frame["Jultag"] = 57
+    export_database(client, target, options)
+    assert cdc.reads == 4
+    assert count() == [
+        ("PH_Sofortmelder_0_akt.txt", 56, 10),
+        ("PH_Sofortmelder_1_akt.txt", 57, 10),
+        ("PH_Sofortmelder_2_akt.txt", 56, 10),
+    ]
+
+    # Changing the export criteria will replace all observations
+    export_database(client, target, {**options, "station-id": ["1", "2"]})
+    assert cdc.reads == 7
+    assert count() == [(f"PH_Sofortmelder_{i}_akt.txt", 57, 2) for i in range(3)]
+
+    connection = sqlite3.connect(tmp_path / "incremental.sqlite")
+    assert connection.execute("SELECT COUNT(DISTINCT id) FROM dwd_observation").fetchone() == (6,)
+    assert connection.execute("SELECT COUNT(*) FROM dwd_phenology").fetchone() == (6,)
+
+    # Rows of files which vanished from the server will be removed, without acquiring any other file
+    cdc.ftp.count = 2
+    export_database(client, target, {**options, "station-id": ["1", "2"]})
+    assert cdc.reads == 7
+    assert count() == [(f"PH_Sofortmelder_{i}_akt.txt", 57, 2) for i in range(2)]
+    files = connection.execute("SELECT file FROM dwd_export_file ORDER BY file").fetchall()
+    assert files == [("PH_Sofortmelder_0_akt.txt",), ("PH_Sofortmelder_1_akt.txt",)]
+
+
+def test_export_all(tmp_path, monkeypatch):
+    """
+    Verify exporting all datasets and partitions concurrently, sharing dimension tables,
+    using an FTP session and a progress bar line per export, and summarizing the throughput.
+    """
+    import logging
+    import sqlite3
+    from types import SimpleNamespace
+
+    import attr
+
+    from phenodata.dwd import export
+    from phenodata.dwd.cdc import DwdCdcClient
+
+    static = StaticCdcClient(2, rows=10)
+    dimension_reads = []
+
+    @attr.s
+    class StaticDwdCdcClient(DwdCdcClient):
+        baseurl = "ftp://localhost"
+
+        def get_dataframe(self, url=None, path=None, index_column=None, coerce_int=False):
+            if "/help/" in url:
+                dimension_reads.append(url)
+            return static.get_dataframe(url, index_column=index_column, coerce_int=coerce_int)
+
+        def get_dataframes(self, urls, index_column=None, coerce_int=False):
+            for url in urls:
+                yield url, self.get_dataframe(url, index_column=index_column, coerce_int=coerce_int)
+
+    sessions = []
+
+    def session():
+        sessions.append(StaticFTPSession(2))
+        return sessions[-1]
+
+    positions = []
+    progressbar = export.iterate_with_progressbar
+
+    def iterate_with_progressbar(items, position=None, **kwargs):
+        positions.append(position)
+        return progressbar(items, position=position, **kwargs)
+
+    monkeypatch.setattr(export, "FTPSession", session)
+    monkeypatch.setattr(export, "iterate_with_progressbar", iterate_with_progressbar)
+    monkeypatch.chdir(tmp_path)
+
+    handlers = list(logging.getLogger().handlers)
+    options = {"source": "dwd", "filter": None, "all": False, "station-id": ["1", "2"]}
+    summary = export.export_database_all(StaticDwdCdcClient(ftp=StaticFTPSession(2)), None, options, workers=2)
+
+    # Each export uses its own FTP session, closed afterwards, and its own progress bar line
+    assert len(sessions) == 4
+    assert all(session.closed for session in sessions)
+    assert sorted(positions) == [0, 1, 2, 3]
+    assert logging.getLogger().handlers == handlers
+    assert dimension_reads and len(dimension_reads) == len(set(dimension_reads))
+    assert summary["target"].tolist() == [
+        f"sqlite:///phenodata-dwd-{dataset}-{partition}.sqlite"
+        for partition in ["recent", "historical"] for dataset in ["immediate", "annual"]]
+    assert summary["observations"].tolist() == [2 * 2] * 4
+    assert (summary["rate"] > 0).all()
+
+    connection = sqlite3.connect(tmp_path / "phenodata-dwd-annual-historical.sqlite")
+    assert connection.execute("SELECT dataset, partition, COUNT(*) FROM dwd_phenology GROUP BY 1, 2").fetchall() == [("annual", "historical", 4)]
+
+    # Exports taking no measurable time have no rate
+    monkeypatch.setattr(export, "time", SimpleNamespace(perf_counter=lambda: 0.0))
+    summary = export.export_database_all(StaticDwdCdcClient(ftp=StaticFTPSession(2)), None, options, workers=2)
+    assert summary["rate"].isna().all()
+
+
+def test_export_iterate_observations(monkeypatch):
+    """
+    Verify observations streamed file by file are filtered like the result of
+    ``get_observations``, resolving text-based criteria only once.
+    """
+    from phenodata.dwd.export import iterate_observations
+
+    cdc = StaticCdcClient(3, rows=10)
+    client = DwdPhenoDataClient(cdc=cdc, dataset="immediate")
+    options = {"partition": "recent", "station-id": ["1", "2", "3"], "station": ["station 2", "station 3"], "species": ["hazel"]}
+
+    calls = []
+    resolve_patterns = client.resolve_patterns
+    monkeypatch.setattr(client, "resolve_patterns", lambda criteria: calls.append(criteria) or resolve_patterns(criteria))
+
+    frames = list(iterate_observations(client, client.scan_files("recent"), options))
+    assert len(frames) == 3
+    assert len(calls) == 1
+    assert [frame["file"].unique().tolist() for frame in frames] == [[f"PH_Sofortmelder_{i}_akt.txt"] for i in range(3)]
+
+    expected = client.get_observations(options)
+    result = pd.concat(frames, ignore_index=True).drop(columns=["file"])
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+
+
+def test_export_sqlite_stream(tmp_path, monkeypatch):
+    """
+    Verify exports stream observations into the database in batches.
+    """
+    import sqlite3
+
+    from phenodata.dwd.export import export_database
+    from phenodata.dwd.model import DwdPhenoDatabase
+
+    monkeypatch.setattr(DwdPhenoDatabase, "batch_size", 5)
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(4, rows=10), dataset="immediate")
+    target = f"sqlite:///{tmp_path / 'stream.sqlite'}"
+    options = {"dataset": "immediate", "partition": "recent", "filter": None, "all": False, "station-id": ["1", "2", "3"]}
+
+    # Record the observation batches written to the database
+    batches = []
+    to_sql_table = DwdPhenoDatabase.to_sql_table
+
+    def record(self, engine, frame, table_name, **kwargs):
+        if table_name == "dwd_observation":
+            batches.append((len(frame), kwargs.get("if_exists")))
+        return to_sql_table(self, engine, frame, table_name, **kwargs)
+
+    monkeypatch.setattr(DwdPhenoDatabase, "to_sql_table", record)
+
+    assert export_database(client, target, options, info=False) == 4 * 3
+    assert batches == [(6, "replace"), (6, "append")]
+
+    connection = sqlite3.connect(tmp_path / "stream.sqlite")
+    assert connection.execute("SELECT MIN(id), MAX(id), COUNT(DISTINCT id) FROM dwd_observation").fetchone() == (0, 11, 12)
+    assert connection.execute("SELECT COUNT(DISTINCT file) FROM dwd_observation").fetchone() == (4,)
+    assert connection.execute("SELECT COUNT(*) FROM dwd_phenology WHERE source = 'dwd'").fetchone() == (12,)
+
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_export_dataset(tmp_path, format):
+    """
+    Verify exporting to a Hive-partitioned dataset of Parquet or Arrow IPC files.
+    """
+    pytest.importorskip("pyarrow")
+    import pyarrow.dataset as ds
+
+    from phenodata.dwd.export import export_database
+
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(3, rows=10), dataset="annual")
+    options = {"dataset": "annual", "partition": "recent", "filter": None, "all": False}
+
+    # Exporting twice replaces the observations of the same dataset and partition
+    export_database(client, f"{format}:///{tmp_path}", options, info=False)
+    assert export_database(client, f"{format}:///{tmp_path}", options, info=False) == 3 * 10
+
+    extension = "parquet" if format == "parquet" else "arrow"
+    assert (tmp_path / f"station.{extension}").exists()
+    assert (tmp_path / "observation" / "dataset=annual" / "partition=recent" / "reference_year=2023").is_dir()
+
+    dataset = ds.dataset(tmp_path / "observation", format="parquet" if format == "parquet" else "ipc", partitioning="hive")
+    table = dataset.to_table(filter=ds.field("reference_year") == 2023)
+    assert table.num_rows == 3 * 10
+    assert sorted(table.column("id").to_pylist()) == list(range(3 * 10))
+    assert set(table.column("file").to_pylist()) == {f"PH_Sofortmelder_{i}_akt.txt" for i in range(3)}
+
+
+def test_export_duckdb(tmp_path):
+    """
+    Verify exporting to a DuckDB database, including the ``dwd_phenology`` views.
+    """
+    duckdb = pytest.importorskip("duckdb")
+
+    from phenodata.dwd.export import export_database
+
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(3, rows=10), dataset="annual")
+    options = {"dataset": "annual", "partition": "recent", "filter": None, "all": False, "station-id": ["1", "2"]}
+    target = f"duckdb:///{tmp_path / 'phenodata.duckdb'}"
+
+    assert export_database(client, target, options, info=False) == 3 * 2
+    assert export_database(client, target, {**options, "materialize": True}, info=False) == 3 * 2
+
+    connection = duckdb.connect(str(tmp_path / "phenodata.duckdb"))
+    assert connection.execute("SELECT table_type FROM information_schema.tables WHERE table_name = 'dwd_phenology'").fetchone() == ("BASE TABLE",)
+    assert connection.execute("""
+        SELECT station_id, group_name, COUNT(*) FROM dwd_phenology_group
+        WHERE species_name_en = 'hazel' GROUP BY station_id, group_name ORDER BY station_id, group_name
+    """).fetchall() == [
+        (1, "mellifera-de-primary", 3),
+        (1, "mellifera-de-primary-openhive", 3),
+        (2, "mellifera-de-primary", 3),
+        (2, "mellifera-de-primary-openhive", 3),
+    ]
+
+
+def test_export_sqlite_fulltext(tmp_path):
+    """
+    Verify full text search on station, species, and phase names.
+    """
+    import sqlite3
+
+    from phenodata.dwd.export import acquire_database
+
+    connection = sqlite3.connect(":memory:")
+    if "ENABLE_FTS5" not in [option for option, in connection.execute("PRAGMA compile_options")]:
+        pytest.skip("SQLite lacks FTS5")
+
+    cdc = StaticCdcClient(2, rows=10)
+    cdc.dimensions["Stationen_Sofortmelder"].loc[9, "Stationsname"] = "München"
+    client = DwdPhenoDataClient(cdc=cdc, dataset="immediate")
+    options = {"dataset": "immediate", "partition": "recent", "filter": None, "all": False}
+    db = acquire_database(client, options=options).with_canonical_column_names()
+    db.to_sql(f"sqlite:///{tmp_path / 'fulltext.sqlite'}", fulltext=True)
+
+    connection = sqlite3.connect(tmp_path / "fulltext.sqlite")
+    stations = connection.execute("SELECT id, station_name FROM dwd_station_search WHERE search MATCH 'station 3'").fetchall()
+    assert stations == [(3, "Station 3")]
+    assert connection.execute("SELECT COUNT(*) FROM dwd_station_search WHERE search MATCH 'brandenburg'").fetchone() == (10,)
+    assert connection.execute("SELECT id FROM dwd_station_search WHERE search MATCH 'munchen'").fetchall() == [(9,)]
+    assert connection.execute("SELECT id FROM dwd_species_search WHERE search MATCH 'hazel'").fetchall() == [(113,)]
+    assert connection.execute("SELECT id FROM dwd_species_search WHERE search MATCH 'corylus'").fetchall() == [(113,)]
+    assert connection.execute("SELECT id FROM dwd_phase_search WHERE search MATCH 'flowering'").fetchall() == [(5,)]
+
+    sql = "SELECT COUNT(*) FROM dwd_phenology WHERE station_id IN (SELECT id FROM dwd_station_search WHERE search MATCH 'station 3')"
+    assert connection.execute(sql).fetchone() == (2,)
+
+    # Exporting again replaces the full text search tables
+    db.to_sql(f"sqlite:///{tmp_path / 'fulltext.sqlite'}")
+    names = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE name LIKE '%_fts%' OR name LIKE '%_search'")]
+    assert names == []
@@ -1,8 +1,10 @@
 import json
 
+import pandas as pd
 from datadiff.tools import assert_equal
 
-from tests.util import run_command
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from tests.util import StaticCdcClient, run_command
 
 
 
@@ -60,3 +62,40 @@ def test_cli_forecast_annual_recent(capsys):
         "Station": "Berlin-Dahlem, Berlin"
     }
     assert_equal(response[0], first)
+
+
+def test_cli_forecast_multiple_years(capsys):
+    """
+    CLI test: Verify the `forecast` subcommand works with multiple target years.
+    """
+    run_command("phenodata forecast --source=dwd --dataset=immediate --partition=recent --filename=Hasel --station-id=7521,7532 --forecast-year=2025,2026 --humanize --format=json")
+
+    out, err = capsys.readouterr()
+    response = json.loads(out)
+
+    first = {
+        "Jahr": 2025,
+        "Datum": "2025-02-26",
+        "Tag": 57,
+        "Spezies": "common hazel",
+        "Phase": "beginning of flowering",
+        "Station": "Norder-Hever-Koog, Schleswig-Holstein"
+    }
+    assert_equal(response[0], first)
+    assert_equal(sorted(set(item["Jahr"] for item in response)), [2025, 2026])
+    assert_equal(len(response) % 2, 0)
+
+
+def test_forecast_dates():
+    """
+    Verify forecast dates stay datetime values, so binary columnar output preserves them.
+    """
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(2, rows=10), dataset="immediate")
+    forecast = client.get_forecast({"partition": "recent", "station-id": ["1"]}, forecast_year=[2025, 2026])
+
+    assert pd.api.types.is_datetime64_any_dtype(forecast["Datum"])
+    assert forecast["Datum"].tolist() == [pd.Timestamp("2025-02-25"), pd.Timestamp("2026-02-25")]
+    assert forecast["Referenzjahr"].tolist() == [2025, 2026]
+
+    forecast = client.get_forecast({"partition": "recent", "station-id": ["1"]}, forecast_year=2025)
+    assert "Referenzjahr" not in forecast.columns
@@ -1,10 +1,11 @@
 import json
 import sys
 
+import pandas as pd
 import pytest
 from datadiff.tools import assert_equal
 
-from tests.util import run_command
+from tests.util import StaticDimensionClient, run_command
 
 
 def test_cli_list_species(capsys):
@@ -25,6 +26,40 @@ def test_cli_list_species(capsys):
     assert_equal(response[0], first)
 
 
+def test_cli_list_species_format_ndjson(capsys, tmp_path):
+    """
+    CLI test: Verify the `list-species` subcommand works with NDJSON output to a file.
+    """
+    output = tmp_path / "species.ndjson"
+    run_command(f"phenodata list-species --source=dwd --format=ndjson --output={output}")
+
+    out, err = capsys.readouterr()
+    assert out == ""
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert len(lines) > 1
+    assert_equal(json.loads(lines[0]), {
+      "Objekt_ID": 25,
+      "Objekt": "Rüben",
+      "Objekt_englisch": "beet",
+      "Objekt_latein": "Beta vulgaris"
+    })
+
+
+def test_cli_list_species_format_parquet(tmp_path):
+    """
+    CLI test: Verify the `list-species` subcommand works with Parquet output.
+    """
+    pytest.importorskip("pyarrow")
+
+    output = tmp_path / "species.parquet"
+    run_command(f"phenodata list-species --source=dwd --format=parquet --output={output}")
+
+    species = pd.read_parquet(output)
+    assert species.index.name == "Objekt_ID"
+    assert species.loc[25, "Objekt_englisch"] == "beet"
+
+
 def test_cli_list_phases(capsys):
     """
     CLI test: Verify the `list-phases` subcommand works.
@@ -172,3 +207,39 @@ def test_cli_list_urls_immediate_recent(capsys):
     response = out.splitlines()
 
     assert response[0].startswith("ftp://opendata.dwd.de/climate_environment/CDC/observations_germany/phenology/immediate_reporters/crops/recent")
+
+
+def test_dimension_table_registry():
+    """
+    Verify dimension tables and derived objects are shared, until the table's modification time changes.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from phenodata.dwd.pheno import DimensionTableRegistry
+
+    cdc = StaticDimensionClient()
+    registry = DimensionTableRegistry()
+    path = "/help/PH_Beschreibung_Pflanze.txt"
+
+    # Concurrent threads share a single read
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        frames = list(pool.map(lambda _: registry.get(cdc, path), range(8)))
+    assert cdc.reads == 1
+    assert all(frame["Objekt"].tolist() == ["Hasel 1"] for frame in frames)
+
+    # Modifying the handed out view does not modify the registry
+    frames[0]["Objekt_englisch"] = "hazel"
+    assert "Objekt_englisch" not in registry.get(cdc, path)
+
+    derived = registry.derive(cdc, path, "index", lambda: object())
+    assert registry.derive(cdc, path, "index", lambda: object()) is derived
+    assert cdc.reads == 1
+
+    # Changing the modification time re-reads the table, and discards derived objects
+    cdc.ftp.mtimes[cdc.baseurl + path] = "2023-03-02T00:00:00"
+    assert registry.get(cdc, path)["Objekt"].tolist() == ["Hasel 2"]
+    assert registry.derive(cdc, path, "index", lambda: object()) is not derived
+    assert cdc.reads == 2
+
+    registry.get(cdc, path)
+    assert cdc.reads == 2
@@ -1,10 +1,12 @@
 import json
 
 import marko
+import pandas as pd
 import pytest
 from datadiff.tools import assert_equal
 
-from tests.util import run_command
+from phenodata.dwd.pheno import DwdPhenoDataClient, ResultCache
+from tests.util import StaticCdcClient, StaticCsvFTPSession, run_command
 
 
 
@@ -245,3 +247,158 @@ def test_cli_observations_format_tabular(capsys):
 
     assert html.startswith("<p>|   Jahr | Datum      |   Tag | Spezies")
     assert html.endswith("| Feldwert nicht beanstandet [1] |</p>\n")
+
+
+def test_parse_workers():
+    """
+    Verify parsing CSV files using worker processes yields the same DataFrames, in the
+    same order, while only retrieving a bounded number of files ahead.
+    """
+    pytest.importorskip("pyarrow")
+
+    from phenodata.dwd.cdc import DwdCdcClient
+
+    header = "Stations_id;Referenzjahr;Qualitaetsniveau;Objekt_id;Phase_id;Eintrittsdatum;Eintrittsdatum_QB;Jultag;eor;\r\n"
+    payloads = {
+        f"ftp://localhost/PH_Sofortmelder_{i}_akt.txt":
+            "" if i == 3 else header + "".join(f"  {station};2023;10;113;5;20230225;1;{50 + i};eor;\r\n" for station in range(i + 1))
+        for i in range(10)
+    }
+    urls = list(payloads)
+
+    sequential = list(DwdCdcClient(ftp=StaticCsvFTPSession(payloads)).get_dataframes(urls))
+
+    ftp = StaticCsvFTPSession(payloads)
+    client = DwdCdcClient(ftp=ftp, parse_workers=2)
+    window = client.parse_workers * 2
+    parallel = []
+    for position, item in enumerate(client.get_dataframes(urls)):
+        assert len(ftp.retrieved) <= position + window
+        parallel.append(item)
+
+    assert [url for url, _ in parallel] == urls
+    assert parallel[3][1] is None and sequential[3][1] is None
+    for (_, expected), (_, actual) in zip(sequential, parallel):
+        if expected is not None:
+            pd.testing.assert_frame_equal(actual, expected)
+    assert [frame["Jultag"].tolist() for _, frame in parallel if frame is not None][:3] == [[50], [51, 51], [52, 52, 52]]
+
+
+def test_filter_by_patterns():
+    """
+    Verify text-based filters on species, phases, and stations, resolved against the dimension tables.
+    """
+    from phenodata.dwd.pheno import DwdPhenoDataHumanizer
+
+    cdc = StaticCdcClient(1, rows=10)
+    cdc.frame["Objekt_id"] = [113 if station % 2 else 127 for station in cdc.frame["Stations_id"]]
+    cdc.frame["Phase_id"] = [5 if station < 5 else 6 for station in cdc.frame["Stations_id"]]
+    cdc.dimensions["Pflanze"] = pd.DataFrame({
+        "Objekt_ID": [113, 127],
+        "Objekt": ["Hasel", "Schneeglöckchen"],
+        "Objekt_englisch": ["hazel", "snowdrop"],
+        "Objekt_latein": ["Corylus avellana", "Galanthus nivalis"],
+    })
+    cdc.dimensions["Phase"] = pd.DataFrame({
+        "Phase_ID": [5, 6],
+        "Phase": ["Beginn der Bluete", "Blattentfaltung"],
+        "Phase_englisch": ["beginning of flowering", "leaf unfolding"],
+    })
+
+    # Station 9 has been closed, so it is missing in the list of active stations
+    cdc.dimensions["Stationen_Sofortmelder"].loc[9, "Datum Stationsaufloesung"] = "2020-01-01"
+
+    humanizer = DwdPhenoDataHumanizer(language="english", long_station=False, show_ids=False)
+    client = DwdPhenoDataClient(cdc=cdc, humanizer=humanizer, dataset="immediate")
+
+    def stations(**criteria):
+        return client.get_observations({"partition": "recent", **criteria})["Stations_id"].tolist()
+
+    assert stations(species=["hazel"]) == [1, 3, 5, 7, 9]
+    assert stations(species=["galanthus"]) == [0, 2, 4, 6, 8]
+    assert stations(species=["^hasel$|schnee"]) == list(range(10))
+    assert stations(phase=["leaf"]) == [5, 6, 7, 8, 9]
+    assert stations(species=["snowdrop"], phase=["blatt"]) == [6, 8]
+    assert stations(station=["station 3", "station 4"]) == [3, 4]
+    assert stations(species=["spam"]) == []
+
+    # Stations are resolved using the list of active stations
+    assert stations(station=["station 9"]) == []
+
+    # Filtering by other criteria retains observations of closed stations,
+    # unless humanizing them, which needs the station names
+    assert 9 in stations(species=["hazel"], phase=["leaf"])
+    humanized = client.get_observations({"partition": "recent", "species": ["hazel"], "phase": ["leaf"]}, humanize=True)
+    assert humanized["Station"].tolist() == ["Station 5, Brandenburg", "Station 7, Brandenburg"]
+
+
+@pytest.mark.parametrize("language", [None, "english", "german", "latin"])
+@pytest.mark.parametrize("long_station", [False, True])
+@pytest.mark.parametrize("show_ids", [False, True])
+def test_humanizer(language, long_station, show_ids):
+    """
+    Verify the labels of humanized observations, for all languages and options.
+    """
+    from phenodata.dwd.pheno import DwdPhenoDataHumanizer
+
+    cdc = StaticCdcClient(2, rows=10)
+    cdc.dimensions["Qualitaetsniveau"] = pd.DataFrame({"Qualitaetsniveau": [5, 10], "Beschreibung": ["plausibel", "ROUTKLI"]})
+    cdc.frame.loc[cdc.frame["Stations_id"] == 3, "Qualitaetsniveau"] = 5
+    humanizer = DwdPhenoDataHumanizer(language=language, long_station=long_station, show_ids=show_ids)
+    client = DwdPhenoDataClient(cdc=cdc, humanizer=humanizer, dataset="immediate")
+    options = {"partition": "recent", "station-id": ["3", "1"]}
+
+    raw = client.get_observations(options)
+    result = client.get_observations(options, humanize=True)
+
+    def label(text, identifier):
+        return f"{text} [{identifier}]" if show_ids else text
+
+    german = language == "german"
+    species = {"german": "Hasel", "latin": "Corylus avellana"}.get(language, "hazel")
+    phase = "Beginn der Bluete" if german else "beginning of flowering"
+    region = ", Luchland, Bellin und Glin" if long_station else ""
+    quality_levels = {10: "ROUTKLI geprüft und korrigiert" if german else "ROUTKLI validated and corrected", 5: "plausibel"}
+
+    assert list(result.columns) == ["Jahr", "Datum", "Tag", "Spezies", "Phase", "Station", "QS-Level", "QS-Byte"]
+    assert result["Spezies"].tolist() == [label(species, 113)] * len(raw)
+    assert result["Phase"].tolist() == [label(phase, 5)] * len(raw)
+    assert result["Station"].tolist() == [label(f"Station {station}{region}, Brandenburg", station) for station in raw["Stations_id"]]
+    assert result["QS-Level"].tolist() == [label(quality_levels[level], level) for level in raw["Qualitaetsniveau"]]
+    assert result["QS-Byte"].tolist() == [label("ungeprüft", 1)] * len(raw)
+
+
+def test_result_cache(tmp_path):
+    """
+    Verify results are served from the result cache, until a source file changes.
+    """
+    pytest.importorskip("pyarrow")
+
+    cdc = StaticCdcClient(5)
+    client = DwdPhenoDataClient(cdc=cdc, dataset="immediate", results=ResultCache(path=str(tmp_path)))
+    options = {"partition": "recent", "station-id": ["3", "1", "2"]}
+
+    first = client.get_observations(options)
+    assert cdc.reads == 5
+    assert len(first) == 5 * 3
+
+    # Same criteria in different order will be served from the cache
+    second = client.get_observations(dict(options, **{"station-id": ["1", "2", "3"]}))
+    assert cdc.reads == 5
+    pd.testing.assert_frame_equal(first, second, check_dtype=False)
+
+    # Changing a source file invalidates the cache entry
+    cdc.ftp.mtimes["ftp://localhost/observations_germany/phenology/immediate_reporters/recent/PH_Sofortmelder_0_akt.txt"] = "2023-03-02T00:00:00"
+    client.get_observations(options)
+    assert cdc.reads == 10
+
+
+def test_result_cache_eviction(tmp_path):
+    """
+    Verify the least recently used entries will be evicted from the result cache.
+    """
+    pytest.importorskip("pyarrow")
+
+    cache = ResultCache(path=str(tmp_path), max_size=0)
+    cache.set("foo", pd.DataFrame({"value": range(10)}))
+    assert cache.get("foo") is None
@@ -0,0 +1,31 @@
+import time
+
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from tests.util import StaticCdcClient
+
+
+def measure_query(count, repeat=3):
+    """
+    Return best wall clock time of acquiring observation data from `count` files.
+    """
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(count), dataset="immediate")
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = client.query(partition="recent")
+        durations.append(time.perf_counter() - start)
+    assert len(results) == count * 2_000
+    return min(durations)
+
+
+def test_query_scales_linearly():
+    """
+    Verify data acquisition scales linearly with the number of files.
+
+    Going from 10 to 500 files multiplies the amount of data by 50. When
+    accumulating the results grows quadratically, the runtime grows by a
+    factor of way beyond 100, while linear accumulation stays below 50.
+    """
+    small = measure_query(10)
+    large = measure_query(500)
+    assert large / small < 100
@@ -1,8 +1,12 @@
 import json
 
+import pandas as pd
+import pytest
 from datadiff.tools import assert_equal
 
-from tests.util import run_command
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from phenodata.util import TextSearchIndex
+from tests.util import StaticCdcClient, run_command
 
 
 def test_cli_stations_immediate(capsys):
@@ -93,3 +97,138 @@ def test_cli_stations_annual(capsys):
         "Bundesland": "Bayern"
     }
     assert_equal(response[0], first)
+
+
+def test_cli_nearest_stations_batch(capsys):
+    """
+    CLI test: Verify the `nearest-stations` subcommand works with multiple positions.
+    """
+    run_command("phenodata nearest-stations --source=dwd --dataset=immediate --latitude=52.520007,48.137154 --longitude=13.404954,11.576124 --limit=3 --format=json")
+
+    out, err = capsys.readouterr()
+    response = json.loads(out)
+
+    assert len(response) == 6
+    assert [item["Punkt"] for item in response] == [0, 0, 0, 1, 1, 1]
+    assert_equal(response[0], dict(nearest_station, **{"Punkt": 0, "Punkt.Breite": 52.520007, "Punkt.Laenge": 13.404954}))
+
+
+def test_cli_nearest_stations_input(capsys, tmp_path):
+    """
+    CLI test: Verify the `nearest-stations` subcommand works with positions from a CSV file.
+    """
+    positions = tmp_path / "positions.csv"
+    positions.write_text("name,latitude,longitude\nBerlin,52.520007,13.404954\nMünchen,48.137154,11.576124\n")
+
+    run_command(f"phenodata nearest-stations --source=dwd --dataset=immediate --input={positions} --limit=3 --radius=30000 --format=json")
+
+    out, err = capsys.readouterr()
+    response = json.loads(out)
+
+    assert all(item["Distanz"] <= 30000 for item in response)
+    assert {item["name"] for item in response if item["Punkt"] == 0} == {"Berlin"}
+    assert_equal(response[0], dict(nearest_station, **{"Punkt": 0, "name": "Berlin", "Punkt.Breite": 52.520007, "Punkt.Laenge": 13.404954}))
+
+
+def test_cli_stations_filter_transliterated(capsys):
+    """
+    CLI test: Verify filtering stations matches umlauts by their transliteration.
+    """
+    run_command("phenodata list-stations --source=dwd --dataset=annual --filter='Fraenkische Alb' --format=json")
+    transliterated = json.loads(capsys.readouterr().out)
+
+    run_command("phenodata list-stations --source=dwd --dataset=annual --filter='Fränkische Alb' --format=json")
+    original = json.loads(capsys.readouterr().out)
+
+    assert len(original) > 0
+    assert_equal(transliterated, original)
+
+
+def test_cli_stations_filter_fuzzy(capsys):
+    """
+    CLI test: Verify filtering stations with fuzzy matching tolerates typos.
+    """
+    run_command("phenodata list-stations --source=dwd --dataset=immediate --filter='Braunschwieg' --match=fuzzy --format=json")
+
+    out, err = capsys.readouterr()
+    response = json.loads(out)
+
+    assert "Braunschweig (Ph)" in [item["Stationsname"] for item in response]
+
+
+def test_text_search_index():
+    """
+    Verify the search modes of the text search index.
+    """
+    frame = pd.DataFrame({
+        "Stationsname": ["München-Stadt", "Lauterhofen-Trautmannshofen", "Berlin-Dahlem", "Braunschweig (Ph)"],
+        "Bundesland": ["Bayern", "Bayern", "Berlin", None],
+    })
+    index = TextSearchIndex(frame, ["Stationsname", "Bundesland"])
+
+    assert list(index.search("MUENCHEN")) == [0]
+    assert list(index.search("hofen-traut")) == [1]
+    assert list(index.search("berlin|bayern")) == [0, 1, 2]
+    assert list(index.search("^bayern$")) == [0, 1]
+    assert list(index.search("^ber")) == [2]
+    assert list(index.search(r"\(ph\)$")) == [3]
+    assert list(index.search("stadt bayern")) == []
+    assert list(index.search("ber da", mode="prefix")) == [2]
+    assert list(index.search("brau", mode="prefix")) == [3]
+    assert list(index.search("munchen", mode="fuzzy")) == [0]
+    assert list(index.search("braunschwieg", mode="fuzzy")) == [3]
+
+
+def test_nearest_stations():
+    """
+    Verify nearest stations found by the spatial index, compared with computing all distances.
+    """
+    import numpy as np
+
+    from phenodata.util import haversine_distance
+
+    cdc = StaticCdcClient(1, rows=50)
+    random = np.random.default_rng(42)
+    stations = cdc.dimensions["Stationen_Sofortmelder"]
+    stations["geograph.Breite"] = random.uniform(47.3, 55.0, len(stations))
+    stations["geograph.Laenge"] = random.uniform(5.9, 15.0, len(stations))
+    client = DwdPhenoDataClient(cdc=cdc, dataset="immediate")
+
+    def expected(latitude, longitude, limit):
+        distances = stations.apply(
+            lambda station: haversine_distance((station["geograph.Laenge"], station["geograph.Breite"]), (longitude, latitude)), axis=1)
+        return distances.sort_values(kind="stable").head(limit)
+
+    points = [(52.52, 13.40), (48.14, 11.58), (53.55, 9.99)]
+    for latitude, longitude in points:
+        result = client.nearest_stations(latitude, longitude, limit=5)
+        reference = expected(latitude, longitude, 5)
+        assert result.index.tolist() == reference.index.tolist()
+        np.testing.assert_allclose(result["Distanz"], reference, rtol=1e-9)
+
+    batch = client.nearest_stations_batch(points, limit=3, radius=80_000)
+    for number, (latitude, longitude) in enumerate(points):
+        reference = expected(latitude, longitude, 3)
+        reference = reference[reference <= 80_000]
+        assert batch.loc[[number], "Stations_id"].tolist() == reference.index.tolist()
+        np.testing.assert_allclose(batch.loc[[number], "Distanz"], reference, rtol=1e-9)
+
+
+def test_nearest_stations_invalid():
+    """
+    Verify invalid limits and non-finite positions are rejected, instead of yielding wrong neighbours.
+    """
+    client = DwdPhenoDataClient(cdc=StaticCdcClient(1, rows=5), dataset="immediate")
+
+    for limit in [0, -1]:
+        with pytest.raises(ValueError, match="must be at least 1"):
+            client.nearest_stations(52.52, 13.40, limit=limit)
+
+    with pytest.raises(ValueError, match="must be finite numbers"):
+        client.nearest_stations_batch([(52.52, 13.40), (float("nan"), 11.58)])
+
+    positions = pd.DataFrame({"latitude": [52.52, 48.14, 53.55, None], "longitude": [13.40, 11.58, 9.99, 8.80]})
+    results = client.nearest_stations_stream([positions.iloc[:2], positions.iloc[2:]])
+    assert len(next(results)) == 2 * 5
+    with pytest.raises(ValueError, match='Invalid position in input rows 3: Columns "latitude" and "longitude"'):
+        next(results)
@@ -0,0 +1,136 @@
+import pandas as pd
+import pytest
+
+from phenodata.dwd.pheno import DwdPhenoDataClient
+from phenodata.dwd.warehouse import DwdPhenoWarehouse
+from tests.util import StaticCdcClient
+
+
+def test_warehouse_sync_incremental(tmp_path):
+    """
+    Verify synchronizing the local store only acquires files which changed.
+    """
+    pytest.importorskip("pyarrow")
+
+    cdc = StaticCdcClient(5, rows=10)
+    warehouse = DwdPhenoWarehouse(path=str(tmp_path))
+
+    # Initially, all files of both datasets and partitions will be acquired
+    warehouse.sync(cdc)
+    assert cdc.reads == 2 * 2 * 5
+
+    # Nothing changed
+    warehouse.sync(cdc)
+    assert cdc.reads == 2 * 2 * 5
+
+    # Only the changed file will be acquired, and its rows will be replaced
+    cdc.ftp.mtimes["ftp://localhost/observations_germany/phenology/annual_reporters/recent/PH_Sofortmelder_0_akt.txt"] = "2023-03-02T00:00:00"
+    cdc.frame["Jultag"] = 57
+    warehouse.sync(cdc)
+    assert cdc.reads == 2 * 2 * 5 + 1
+
+    # Observations can be read from the store, using the original column names
+    client = DwdPhenoDataClient(cdc=cdc, dataset="annual", store=warehouse)
+    observations = client.get_observations({"partition": "recent", "station-id": ["1"]})
+    assert len(observations) == 5
+    assert sorted(observations["Jultag"]) == [56, 56, 56, 56, 57]
+    assert observations["Eintrittsdatum"].iloc[0] == pd.Timestamp("2023-02-25")
+
+    # Rows record their provenance
+    frame = pd.read_parquet(tmp_path / "dataset=annual" / "partition=recent" / "PH_Sofortmelder_0_akt.parquet")
+    assert list(frame.columns) == [
+        "station_id", "reference_year", "quality_level_id", "species_id", "phase_id",
+        "date", "quality_byte_id", "day_of_year", "source", "dataset", "partition", "file",
+    ]
+    assert frame["file"].iloc[0] == "PH_Sofortmelder_0_akt.txt"
+
+
+def test_warehouse_sync_manifest(tmp_path, monkeypatch):
+    """
+    Verify the manifest is saved periodically, and an interrupted run can be resumed.
+    """
+    pytest.importorskip("pyarrow")
+
+    cdc = StaticCdcClient(5, rows=10)
+    warehouse = DwdPhenoWarehouse(path=str(tmp_path))
+    warehouse.manifest_interval = 2
+    client = DwdPhenoDataClient(cdc=cdc, dataset="annual")
+
+    saves = []
+    save_manifest = warehouse.save_manifest
+    monkeypatch.setattr(warehouse, "save_manifest", lambda manifest: saves.append(len(manifest)) or save_manifest(manifest))
+
+    # The manifest is saved after each second file, and once when finishing
+    warehouse.sync_partition(client, "recent", {})
+    assert saves == [2, 4, 5]
+
+    # Abort the acquisition after three files
+    get_dataframes = cdc.get_dataframes
+
+    def interrupted(urls, **kwargs):
+        for position, item in enumerate(get_dataframes(urls, **kwargs)):
+            if position == 3:
+                raise KeyboardInterrupt()
+            yield item
+
+    monkeypatch.setattr(cdc, "get_dataframes", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        warehouse.sync_partition(client, "historical", warehouse.load_manifest())
+    assert len(warehouse.load_manifest()) == 5 + 3
+
+    # Resuming only acquires the remaining files
+    monkeypatch.setattr(cdc, "get_dataframes", get_dataframes)
+    reads = cdc.reads
+    warehouse.sync_partition(client, "historical", warehouse.load_manifest())
+    assert cdc.reads == reads + 2
+    assert len(warehouse.load_manifest()) == 5 + 5
+
+
+def test_warehouse_query_sql(tmp_path):
+    """
+    Verify SQL queries run directly against the local store.
+    """
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("duckdb")
+
+    cdc = StaticCdcClient(3, rows=10)
+    warehouse = DwdPhenoWarehouse(path=str(tmp_path))
+    warehouse.sync(cdc, datasets=["annual"])
+    client = DwdPhenoDataClient(cdc=cdc, dataset="annual", store=warehouse)
+
+    # The "data" view honors the filter criteria, and uses the original column names
+    options = {"station-id": ["1", "2"], "station": ["Station 2", "Station 3"], "filename": ["Sofortmelder_0"]}
+    data = warehouse.query(client, "SELECT * FROM data", partition="recent", criteria=options)
+    assert len(data) == 1
+    assert data["Stations_id"].tolist() == [2]
+    assert data["Eintrittsdatum"].iloc[0] == pd.Timestamp("2023-02-25")
+
+    # Observations can be joined with dimension tables
+    data = warehouse.query(client, """
+        SELECT species_name_en, "partition", COUNT(*) AS count
+        FROM observation JOIN species ON species_id = species.id
+        GROUP BY species_name_en, "partition" ORDER BY "partition"
+    """, partition="recent")
+    assert data.to_dict(orient="records") == [
+        {"species_name_en": "hazel", "partition": "historical", "count": 30},
+        {"species_name_en": "hazel", "partition": "recent", "count": 30},
+    ]
+
+
+def test_warehouse_query_sql_empty(tmp_path, caplog):
+    """
+    Verify SQL queries against a store which has not been synchronized yet return empty results.
+    """
+    pytest.importorskip("duckdb")
+
+    cdc = StaticCdcClient(3, rows=10)
+    warehouse = DwdPhenoWarehouse(path=str(tmp_path / "missing"))
+    client = DwdPhenoDataClient(cdc=cdc, dataset="annual", store=warehouse)
+
+    data = warehouse.query(client, "SELECT * FROM data", partition="recent", criteria={"station-id": ["1"]})
+    assert data.empty
+    assert list(data.columns) == ["Stations_id", "Referenzjahr", "Qualitaetsniveau", "Objekt_id", "Phase_id", "Eintrittsdatum", "Eintrittsdatum_QB", "Jultag"]
+    assert 'Use "phenodata sync"' in caplog.text
+
+    data = warehouse.query(client, "SELECT COUNT(*) AS count FROM observation", partition="recent")
+    assert data["count"].tolist() == [0]
@@ -0,0 +1,129 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from tabulate import tabulate
+
+from phenodata.writer import DataFrameStreamWriter, TableRenderer, write_columnar
+
+
+frame = pd.DataFrame({
+    "Datum": pd.to_datetime(["2023-02-25", "2023-02-26", "2023-02-27"]),
+    "Jultag": [56, 57, 58],
+}, index=pd.Index([7, 8, 9], name="Punkt"))
+
+
+def write(frames, format, index=False, batch_size=2):
+    stream = io.StringIO()
+    writer = DataFrameStreamWriter(stream, format=format, index=index)
+    writer.batch_size = batch_size
+    with writer:
+        for item in frames:
+            writer.write(item)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_writer_csv(index):
+    """
+    Verify writing CSV in batches yields the same output as serializing at once.
+    """
+    assert write([frame.iloc[:1], frame.iloc[1:]], "csv", index=index) == frame.to_csv(index=index)
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_writer_json(index):
+    """
+    Verify writing JSON in batches yields a single JSON array.
+    """
+    expected = frame.reset_index() if index else frame
+    output = write([frame.iloc[:1], frame.iloc[:0], frame.iloc[1:]], "json", index=index)
+    assert json.loads(output) == json.loads(expected.to_json(orient="records", date_format="iso"))
+
+
+def test_writer_json_empty():
+    assert json.loads(write([frame.iloc[:0]], "json")) == []
+
+
+def test_writer_ndjson():
+    """
+    Verify writing NDJSON yields one JSON object per line.
+    """
+    lines = write([frame], "ndjson").splitlines()
+    assert [json.loads(line)["Jultag"] for line in lines] == [56, 57, 58]
+    assert json.loads(lines[0])["Datum"].startswith("2023-02-25T00:00:00")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_writer_columnar(format):
+    """
+    Verify binary columnar output preserves dtypes, including dates and categoricals.
+    """
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    data = frame.assign(Phase=pd.Categorical(["a", "b", "a"]))
+    stream = io.BytesIO()
+    write_columnar(data, stream, format=format, index=True)
+
+    buffer = pa.py_buffer(stream.getvalue())
+    if format == "parquet":
+        result = pq.read_table(buffer).to_pandas()
+    else:
+        result = pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+    pd.testing.assert_frame_equal(result, data, check_index_type=False)
+
+
+def test_writer_arrow_batches(monkeypatch):
+    """
+    Verify Arrow output is streamed in record batches of ``batch_size`` rows.
+    """
+    pa = pytest.importorskip("pyarrow")
+
+    monkeypatch.setattr(DataFrameStreamWriter, "batch_size", 2)
+    data = frame.assign(Phase=pd.Categorical(["a", "b", "a"]))
+    stream = io.BytesIO()
+    write_columnar(data, stream, format="arrow", index=True)
+
+    reader = pa.ipc.open_stream(pa.py_buffer(stream.getvalue()))
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    result = pa.Table.from_batches(batches).to_pandas()
+    pd.testing.assert_frame_equal(result, data, check_index_type=False)
+
+
+table_frames = {
+    "mixed": pd.DataFrame({
+        "Station": ["Berlin-Dahlem", "Ahaus", "Zinnwald-Georgenfeld"],
+        "Jultag": [56, 157, 8],
+        "Breite": [52.4537, 52.08, float("nan")],
+        "Distanz": [7.0, 12345.678, 0.5],
+        "QS-Byte": ["1", "07", "10"],
+        "Datum": pd.to_datetime(["2023-02-25", "2023-02-26", None]),
+        "Bemerkung": ["1.5", None, "spam"],
+    }, index=pd.Index([7, 18, 9], name="Punkt")),
+    "numeric": pd.DataFrame({
+        "Stations_id": [7, 18, 1234567],
+        "Distanz": [0.25, float("nan"), 3.0],
+    }),
+}
+
+
+@pytest.mark.parametrize("tablefmt", TableRenderer.formats)
+@pytest.mark.parametrize("index", [False, True])
+@pytest.mark.parametrize("name", table_frames)
+def test_table_renderer(tablefmt, index, name):
+    """
+    Verify rendering tables in pages yields the same output as ``tabulate``,
+    including the alignment of floats, missing values, and numeric strings.
+    """
+    data = table_frames[name]
+    stream = io.StringIO()
+    renderer = TableRenderer(stream, format=tablefmt, index=index)
+    renderer.page_size = 2
+    renderer.render(data)
+    expected = tabulate(data, headers=data.columns, showindex=index, tablefmt=tablefmt)
+    assert stream.getvalue() == expected + "\n"
@@ -1,5 +1,8 @@
 import shlex
 import sys
+import time
+
+import pandas as pd
 
 from phenodata.command import run
 
@@ -7,3 +10,121 @@ from phenodata.command import run
 def run_command(command: str):
     sys.argv = shlex.split(command.strip())
     run()
+
+
+class StaticFTPSession:
+    """
+    Pretend to be an FTP server, listing a designated number of observation files.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.mtimes = {}
+        self.closed = False
+
+    def scan_files(self, url, subdir=None, **kwargs):
+        return [{"url": f"{url}/{subdir}/{name}", "name": name, "mtime": self.mtime(f"{url}/{subdir}/{name}")}
+                for name in (f"PH_Sofortmelder_{i}_akt.txt" for i in range(self.count))]
+
+    def mtime(self, url):
+        return self.mtimes.get(url, "2023-03-01T00:00:00")
+
+    def close(self):
+        self.closed = True
+
+
+class StaticCdcClient:
+    """
+    Pretend to be a DWD CDC client, serving the same observation data for each file.
+    """
+
+    baseurl = "ftp://localhost"
+
+    def __init__(self, count, rows=2_000):
+        self.ftp = StaticFTPSession(count)
+        self.reads = 0
+        self.frame = pd.DataFrame({
+            "Stations_id": range(rows),
+            "Referenzjahr": 2023,
+            "Qualitaetsniveau": 10,
+            "Objekt_id": 113,
+            "Phase_id": 5,
+            "Eintrittsdatum": 20230225,
+            "Eintrittsdatum_QB": 1,
+            "Jultag": 56,
+        })
+
+        self.dimensions = {
+            "Stationen_Sofortmelder": pd.DataFrame({
+                "Stations_id": range(rows),
+                "Stationsname": [f"Station {i}" for i in range(rows)],
+                "geograph.Breite": 52.5,
+                "geograph.Laenge": 13.4,
+                "Stationshoehe": 40,
+                "Naturraumgruppe_Code": 78,
+                "Naturraumgruppe": "Luchland",
+                "Naturraum_Code": 7820,
+                "Naturraum": "Bellin und Glin",
+                "Datum Stationsaufloesung": None,
+                "Bundesland": "Brandenburg",
+            }),
+            "Stationen_Jahresmelder": pd.DataFrame({
+                "Stations_id": range(rows),
+                "Stationsname": [f"Station {i}" for i in range(rows)],
+                "geograph.Breite": 52.5,
+                "geograph.Laenge": 13.4,
+                "Stationshoehe": 40,
+                "Naturraumgruppe_Code": 78,
+                "Naturraumgruppe": "Luchland",
+                "Naturraum_Code": 7820,
+                "Naturraum": "Bellin und Glin",
+                "Datum Stationsaufloesung": None,
+                "Bundesland": "Brandenburg",
+            }),
+            "Pflanze": pd.DataFrame({"Objekt_ID": [113], "Objekt": ["Hasel"], "Objekt_englisch": ["hazel"], "Objekt_latein": ["Corylus avellana"]}),
+            "Phase": pd.DataFrame({"Phase_ID": [5], "Phase": ["Beginn der Bluete"], "Phase_englisch": ["beginning of flowering"]}),
+            "Qualitaetsniveau": pd.DataFrame({"Qualitaetsniveau": [10], "Beschreibung": ["ROUTKLI"]}),
+            "Qualitaetsbyte": pd.DataFrame({"Qualitaetsbyte": [1], "Beschreibung": ["ungeprüft"]}),
+        }
+
+    def get_dataframe(self, url=None, path=None, index_column=None, coerce_int=False):
+        for name, frame in self.dimensions.items():
+            if (url or path).endswith(f"_{name}.txt"):
+                return frame.set_index(frame.columns[index_column])
+        self.reads += 1
+        return self.frame.copy()
+
+    def get_dataframes(self, urls, index_column=None, coerce_int=False):
+        for url in urls:
+            yield url, self.get_dataframe(url, index_column=index_column, coerce_int=coerce_int)
+
+
+class StaticCsvFTPSession:
+    """
+    Pretend to be an FTP server, serving DWD-style CSV payloads, and recording retrievals.
+    """
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.retrieved = []
+
+    def retr_cached(self, url, strip_base=None):
+        self.retrieved.append(url)
+        return self.payloads[url]
+
+
+class StaticDimensionClient:
+    """
+    Pretend to be a DWD CDC client, serving a single dimension table, and counting reads.
+    """
+
+    baseurl = "ftp://localhost"
+
+    def __init__(self):
+        self.ftp = StaticFTPSession(0)
+        self.reads = 0
+
+    def get_dataframe(self, url=None, index_column=None):
+        self.reads += 1
+        time.sleep(0.01)
+        return pd.DataFrame({"Objekt_ID": [113], "Objekt": [f"Hasel {self.reads}"]}).set_index("Objekt_ID")